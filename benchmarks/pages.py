@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""Pages for benchmarks: recorded from smart-lab or generated with the same markup."""
+
+
+import os
+import random
+import string
+
+from urllib.parse import urljoin
+
+from metrics_collectors import Companies
+from utils import HtmlFetcher
+
+
+SHARES_PATH = '/q/shares/'
+FIELDS = ('net_income', 'revenue', 'market_cap', 'ev', 'ebitda', 'net_debt', 'roe', 'roa', 'dividend', 'dividend_pr',
+          'net_assets', 'book_value', 'assets', 'capex', 'fcf', 'employees', 'pe', 'ps', 'pb', 'ev_ebitda')
+# Text outside of the tables: menus, news and comments make the real page several times bigger than the tables
+FILLER = '<div class="news"><p>{}</p><a href="/blog/{}">Читать далее</a><script>var x = {};</script></div>\n'
+
+
+def generate_pages(companies=250, years=6, filler_blocks=300, seed=0, quarters=0):
+    """Return dict url path -> html of the list of shares and companies pages.
+
+    If quarters is given, pages of quarterly reports with this number of quarters are added for every company.
+    """
+    rnd = random.Random(seed)
+    last_year = 2019
+    tickers = sorted({''.join(rnd.choices(string.ascii_uppercase, k=4)) for _ in range(companies * 2)})[:companies]
+    filler = ''.join(FILLER.format('Новости рынка ' * 20, num, num) for num in range(filler_blocks))
+
+    pages = dict()
+    shares_rows = []
+    for num, ticker in enumerate(tickers, start=1):
+        analysis_url = f'/q/{ticker}/f/y/'
+        shares_rows.append(
+            f'<tr><td>{num}</td><td>18:45</td><td><a href="/forum/{ticker}">Компания {ticker}</a></td>'
+            f'<td>{ticker}</td><td></td><td><a href="{analysis_url}"><img src="i.png"></a></td>'
+            f'<td>{rnd.uniform(1, 5000):.2f}</td></tr>'
+        )
+        if num % 5 == 0:
+            shares_rows.append(
+                f'<tr><td>{num}</td><td>18:45</td><td>Компания {ticker}-п</td><td>{ticker}P</td>'
+                f'<td></td><td><a href="{analysis_url}"></a></td><td>{rnd.uniform(1, 5000):.2f}</td></tr>'
+            )
+
+        pages[analysis_url] = fin_page(ticker, range(last_year - years + 1, last_year + 1), filler, rnd)
+        if quarters:
+            # The last quarters end with the last year
+            columns = [f'{last_year - num // 4}Q{4 - num % 4}' for num in reversed(range(quarters))]
+            pages[f'/q/{ticker}/f/q/'] = fin_page(ticker, columns, filler, rnd, period='q')
+
+    pages[SHARES_PATH] = (
+        f'<html><head><title>Акции</title></head><body>{filler}'
+        f'<table class="simple-little-table trades-table">'
+        f'<tr><th>№</th><th>Время</th><th>Название</th><th>Тикер</th><th></th><th></th><th>Цена</th></tr>'
+        f'{"".join(shares_rows)}</table>{filler}</body></html>'
+    )
+    return pages
+
+
+def fin_page(ticker, columns, filler, rnd, period='y'):
+    """Return html of the page of financial reports: period "y" - by years, "q" - by quarters."""
+    header = ''.join(f'<td>{column}</td>' for column in columns)
+    rows = [f'<tr class="header_row"><td></td>{header}<td></td><td>LTM</td></tr>']
+    for field in FIELDS:
+        values = ''.join(f'<td>{rnd.uniform(-100, 10000):,.1f}</td>'.replace(',', ' ')
+                         for _ in range(len(columns) + 2))
+        link = f'<a href="/q/{ticker}/f/{period}/{field}/">{field}</a>'
+        rows.append(f'<tr field="{field}"><td>{link}</td>{values}</tr>')
+    return (
+        f'<html><head><title>{ticker}</title></head><body>{filler}<h1>Компания {ticker} ({ticker}) МСФО</h1>'
+        f'<table class="simple-little-table financials">{"".join(rows)}</table>{filler}</body></html>'
+    )
+
+
+def record_pages(directory, site_url='https://smart-lab.ru/', companies=None):
+    """Download the list of shares and companies pages from the site and save them to the directory."""
+    fetcher = HtmlFetcher()
+    shares = Companies(urljoin(site_url, SHARES_PATH), [])
+    shares.fetch()
+    paths = [SHARES_PATH] + sorted({indicators['analysis_url'] for indicators in shares.list.values()})
+    for path in paths[:companies + 1 if companies else None]:
+        file_path = os.path.join(directory, path.strip('/').replace('/', '__') + '.html')
+        with open(file_path, 'w', encoding='utf-8') as page_file:
+            page_file.write(fetcher.fetch_page(urljoin(site_url, path)))
+
+
+def load_pages(directory):
+    """Return dict url path -> html of the pages recorded to the directory."""
+    pages = dict()
+    for file_name in os.listdir(directory):
+        if file_name.endswith('.html'):
+            with open(os.path.join(directory, file_name), encoding='utf-8') as page_file:
+                pages['/' + file_name[:-len('.html')].replace('__', '/') + '/'] = page_file.read()
+    return pages
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks of the scraper stages on recorded or generated pages served by the local stand-in server.
+
+Run from the repository root:
+    python -m benchmarks.run [--pages-dir DIR] [--companies N] [--latency SECONDS] [--error-rate RATE] [-o FILE]
+"""
+
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from datetime import datetime
+from unittest import mock
+from urllib.parse import urljoin
+
+from benchmarks.pages import generate_pages, load_pages, record_pages, SHARES_PATH
+from benchmarks.server import StandInServer
+from indicators_table import IndicatorsTable
+from metrics_collectors import Companies, CompanyFinIndicators
+from page_parsers import PARSERS
+from google_spreadsheets import GoogleSpreadsheets
+from sinks import CsvSink, FanOut
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(func, *args, **kwargs):
+    """Call func. Return its result, seconds and peak of python memory allocations in bytes.
+
+    Allocations are traced during the call, so the time includes tracemalloc overhead.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_companies_fetch(site_url):
+    results = dict()
+    for parser in PARSERS:
+        companies = Companies(urljoin(site_url, SHARES_PATH), [], parser)
+        _, elapsed, peak = measure(companies.fetch)
+        results[parser] = {'seconds': elapsed, 'companies': len(companies.list), 'peak_alloc_bytes': peak}
+    return results
+
+
+def bench_fin_indicators(site_url, pages):
+    """Fetch and parse every company page serially; parse of the pages without network separately."""
+    company_paths = [path for path in pages if path != SHARES_PATH]
+    results = dict()
+    for parser in PARSERS:
+        collectors = [CompanyFinIndicators(path, site_url, path, 1.0, parser=parser) for path in company_paths]
+        indicators, elapsed, peak = measure(lambda: [collector.fetch_fin_indicators() for collector in collectors])
+
+        parse_times = []
+        for collector, path in zip(collectors, company_paths):
+            start = time.perf_counter()
+            collector.parse_page(pages[path])
+            parse_times.append(time.perf_counter() - start)
+        parse_times.sort()
+        results[parser] = {
+            'pages': len(company_paths),
+            'pages_per_second': len(company_paths) / elapsed if elapsed else None,
+            'parse_ms_per_page': 1000 * sum(parse_times) / len(parse_times),
+            'parse_ms_p95': 1000 * parse_times[int(len(parse_times) * 0.95)],
+            'peak_alloc_bytes': peak,
+        }
+    return results, indicators
+
+
+def bench_uploaders(indicators):
+    table = IndicatorsTable.from_indicators(indicators)
+    results = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        def save():
+            with FanOut([CsvSink(os.path.join(directory, 'result.csv'), table.header)]) as fan_out:
+                fan_out.write(table.lines())
+
+        _, elapsed, peak = measure(save)
+        results['csv'] = {'seconds': elapsed, 'lines': len(list(table.lines())), 'peak_alloc_bytes': peak}
+
+    # Google API is replaced by a stub counting requests and sent bytes
+    requests_log = []
+    spreadsheet = mock.Mock()
+    spreadsheet.get_worksheet.return_value.title = 'Sheet'
+    spreadsheet.values_update.side_effect = lambda range_label, params, body: requests_log.append(json.dumps(body))
+    with mock.patch('google_spreadsheets.gspread.authorize') as authorize, \
+            mock.patch('google_spreadsheets.ServiceAccountCredentials'):
+        authorize.return_value.open_by_url.return_value = spreadsheet
+
+        def upload():
+            google_table = GoogleSpreadsheets('url', (0, 3, 1), 'key.json')
+            for line in table.lines():
+                google_table.add_line_cells(line)
+            google_table.upload()
+
+        _, elapsed, peak = measure(upload)
+    results['google_spreadsheets'] = {
+        'seconds': elapsed,
+        'requests': len(requests_log),
+        'bytes': sum(len(body) for body in requests_log),
+        'peak_alloc_bytes': peak,
+    }
+    return results
+
+
+def bench_controller(site_url, workers, companies):
+    """Run scraper.py in a separate process. Peak RSS is measured for the child process."""
+    results = dict()
+    for num_workers in workers:
+        with tempfile.TemporaryDirectory() as directory:
+            command = [sys.executable, os.path.join(REPO_DIR, 'scraper.py'), '--site', site_url,
+                       '-f', 'result.csv', '-w', str(num_workers)]
+            start = time.perf_counter()
+            subprocess.run(command, cwd=directory, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            elapsed = time.perf_counter() - start
+        results[f'workers_{num_workers}'] = {
+            'seconds': elapsed,
+            'pages_per_second': (companies + 1) / elapsed,
+        }
+    # ru_maxrss is the maximum over all finished children, in kilobytes on Linux
+    results['peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_arg_params():
+    cmd_parser = argparse.ArgumentParser(description='Benchmarks of the scraper on the local stand-in server.')
+    cmd_parser.add_argument('--pages-dir', default='',
+                            help='Directory with recorded pages. Default: generated pages')
+    cmd_parser.add_argument('--record', action='store_true',
+                            help='Record pages from smart-lab to --pages-dir and exit')
+    cmd_parser.add_argument('--companies', type=int, default=250,
+                            help='Number of generated companies pages. Default: 250')
+    cmd_parser.add_argument('--latency', type=float, default=0.05,
+                            help='Latency of the server response in seconds. Default: 0.05')
+    cmd_parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Part of the requests answered with error 503. Default: 0')
+    cmd_parser.add_argument('--workers', type=int, nargs='+', default=[1, 8],
+                            help='Numbers of workers for end-to-end runs. Default: 1 8')
+    cmd_parser.add_argument('-o', dest='output', default='benchmark_results.json',
+                            help='File for results. Default: benchmark_results.json')
+    return cmd_parser.parse_args()
+
+
+def main():
+    params = get_arg_params()
+    if params.record:
+        os.makedirs(params.pages_dir, exist_ok=True)
+        record_pages(params.pages_dir, companies=params.companies)
+        return
+
+    pages = load_pages(params.pages_dir) if params.pages_dir else generate_pages(params.companies)
+    companies = len(pages) - 1
+    CompanyFinIndicators.calc_last_fin_year()
+
+    results = dict()
+    with StandInServer(pages, latency=params.latency, error_rate=params.error_rate) as server:
+        results['companies_fetch'] = bench_companies_fetch(server.url)
+        results['fin_indicators'], indicators = bench_fin_indicators(server.url, pages)
+        results['uploaders'] = bench_uploaders(indicators)
+        results['controller'] = bench_controller(server.url, params.workers, companies)
+        results['server'] = {'requests': server.requests, 'errors': server.errors}
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'config': {
+            'pages': 'recorded' if params.pages_dir else 'generated',
+            'companies': companies,
+            'page_bytes_avg': sum(len(html.encode('utf-8')) for html in pages.values()) // len(pages),
+            'latency': params.latency,
+            'error_rate': params.error_rate,
+        },
+        'results': results,
+    }
+    with open(params.output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
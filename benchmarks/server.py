@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""Local stand-in for smart-lab: serves pages from memory with configurable latency and errors."""
+
+
+import random
+import sys
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class QuietServer(ThreadingHTTPServer):
+    """Does not print errors of connections closed by the client: the scraper closes them after the needed table."""
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StandInServer:
+    """HTTP server of the pages. Every request waits latency seconds; error_rate of requests get error_code."""
+
+    def __init__(self, pages, latency=0.0, error_rate=0.0, error_code=503, seed=0):
+        self.pages = {path: html.encode('utf-8') for path, html in pages.items()}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = QuietServer(('127.0.0.1', 0), self.__handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                    failed = server._random.random() < server.error_rate
+                    if failed:
+                        server.errors += 1
+                if server.latency:
+                    threading.Event().wait(server.latency)
+                body = server.pages.get(self.path)
+                if failed or body is None:
+                    self.send_response(server.error_code if failed else 404)
+                    self.send_header('Retry-After', '0')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
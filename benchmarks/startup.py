@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""Startup benchmark: import time, loaded heavy packages and wall time of scraper.py in every CLI mode.
+
+Run from the repository root:
+    python -m benchmarks.startup [--companies N] [--repeat N] [-o FILE]
+"""
+
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime
+
+from benchmarks.pages import generate_pages
+from benchmarks.run import git_revision, REPO_DIR
+from benchmarks.server import StandInServer
+
+
+SCRAPER = os.path.join(REPO_DIR, 'scraper.py')
+# Packages whose import is noticeable at startup
+HEAVY_PACKAGES = ('gspread', 'oauth2client', 'bs4', 'lxml', 'numpy', 'requests')
+
+
+def cli_modes(site_url):
+    """Return dict mode -> command. Google spreadsheets need credentials, so only the import of its mode is run."""
+    return {
+        'help': [SCRAPER, '-h'],
+        'csv': [SCRAPER, '--site', site_url, '-f', 'result.csv'],
+        'stream': [SCRAPER, '--site', site_url, '-f', 'result.csv', '--stream'],
+        'prices_only': [SCRAPER, '--site', site_url, '-f', 'result.csv', '--store', 'snapshots.sqlite',
+                        '--prices-only'],
+        'diff': [SCRAPER, '-f', 'changes.csv', '--store', 'snapshots.sqlite', '--diff', '-2', '-1'],
+        'gsheet_imports': ['-c', 'import scraper, google_spreadsheets'],
+    }
+
+
+def parse_import_time(stderr):
+    """Return total import time in seconds and set of imported top-level packages from -X importtime output."""
+    total = 0
+    packages = set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        packages.add(name.strip().split('.')[0])
+        # Modules imported at the top level are not nested, their cumulative time includes nested imports
+        if not name.startswith('  '):
+            total += int(cumulative)
+    return total / 1e6, packages
+
+
+def bench_mode(command, directory, repeat):
+    # The repository is in the path of imports for the mode without script
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    wall_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + command, cwd=directory, check=True, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        wall_times.append(time.perf_counter() - start)
+    completed = subprocess.run([sys.executable, '-X', 'importtime'] + command, cwd=directory, check=True, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    import_seconds, packages = parse_import_time(completed.stderr)
+    return {
+        'wall_seconds_median': statistics.median(wall_times),
+        'wall_seconds_min': min(wall_times),
+        'import_seconds': import_seconds,
+        'heavy_packages': [package for package in HEAVY_PACKAGES if package in packages],
+    }
+
+
+def get_arg_params():
+    cmd_parser = argparse.ArgumentParser(description='Startup time of the scraper in every CLI mode.')
+    cmd_parser.add_argument('--companies', type=int, default=5,
+                            help='Number of generated companies pages. Default: 5')
+    cmd_parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs of every mode, median and minimum wall time are saved. Default: 5')
+    cmd_parser.add_argument('-o', dest='output', default='startup_results.json',
+                            help='File for results. Default: startup_results.json')
+    return cmd_parser.parse_args()
+
+
+def main():
+    params = get_arg_params()
+    pages = generate_pages(params.companies, filler_blocks=0)
+    results = dict()
+    with StandInServer(pages) as server, tempfile.TemporaryDirectory() as directory:
+        # Two runs in the store for prices refresh and diff modes
+        for _ in range(2):
+            subprocess.run([sys.executable, SCRAPER, '--site', server.url, '-f', 'result.csv',
+                            '--store', 'snapshots.sqlite'], cwd=directory, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for mode, command in cli_modes(server.url).items():
+            results[mode] = bench_mode(command, directory, params.repeat)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'config': {'companies': params.companies, 'repeat': params.repeat},
+        'results': results,
+    }
+    with open(params.output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
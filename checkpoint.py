@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""Checkpoint journal of the run: indicators of the companies fetched before the scraper stopped."""
+
+
+import json
+import os
+
+from collections import namedtuple
+
+from metrics_collectors import CompanyIndicators
+
+
+# Company completed in the run: its indicators and hash of its page
+Checkpoint = namedtuple('Checkpoint', ('indicators', 'page_hash'))
+
+
+class CheckpointJournal:
+    """Appends a line of JSON for every completed company. Every line is flushed to disk at once.
+
+    When resumed, companies of the existing journal are loaded and the journal is continued. Line broken by the crash
+    of the scraper and the lines after it are dropped: loaded companies are written to a temporary file which replaces
+    the journal, so a crash while rewriting does not lose them.
+    """
+
+    def __init__(self, path, resume=False):
+        self._path = path
+        self._completed = self.__load() if resume else dict()
+        if resume:
+            self.__rewrite()
+            self._file = open(path, 'a', encoding='utf-8')
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+
+    def completed(self):
+        """Return dict company -> Checkpoint of the companies loaded from the journal."""
+        return dict(self._completed)
+
+    def record(self, company, indicators, page_hash=None):
+        """Add completed company to the journal."""
+        self.__write(company, indicators, page_hash)
+
+    def close(self):
+        self._file.close()
+
+    def remove(self):
+        """Close and delete the journal. Used when the run is finished."""
+        self.close()
+        os.remove(self._path)
+
+    def __write(self, company, indicators, page_hash):
+        self._file.write(self.__line(company, indicators, page_hash))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def __rewrite(self):
+        """Replace the journal with the loaded companies."""
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as tmp_file:
+            for company, checkpoint in self._completed.items():
+                tmp_file.write(self.__line(company, checkpoint.indicators, checkpoint.page_hash))
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, self._path)
+
+    @staticmethod
+    def __line(company, indicators, page_hash):
+        return json.dumps({'company': company, 'page_hash': page_hash, 'indicators': indicators.to_dict()},
+                          ensure_ascii=False) + '\n'
+
+    def __load(self):
+        completed = dict()
+        if not os.path.exists(self._path):
+            return completed
+        with open(self._path, encoding='utf-8') as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                completed[record['company']] = Checkpoint(CompanyIndicators(**record['indicators']),
+                                                          record['page_hash'])
+        return completed
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+"""Resident mode of the scraper: indicators refreshed on schedule and served by local HTTP/JSON API."""
+
+
+import json
+import threading
+
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telemetry import REGISTRY
+from utils import Logger
+
+
+logger = Logger('scraper')
+
+
+class IndicatorsService:
+    """Keeps the latest indicators of companies in memory and refreshes them every interval seconds.
+
+    refresh is called without arguments and returns list of CompanyIndicators in the order of the table.
+    JSON responses are prepared once after every refresh.
+    """
+
+    def __init__(self, refresh, interval):
+        self._refresh = refresh
+        self._interval = interval
+        self._table = b'[]'
+        self._companies = dict()
+        self._updated_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.__run, name='refresh', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def refresh(self):
+        """Fetch indicators and replace the served ones."""
+        with self._lock:
+            self._refreshing = True
+        try:
+            indicators = self._refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+        companies = {company.ticker: self.__to_json(company.to_dict()) for company in indicators}
+        table = self.__to_json([company.to_dict() for company in indicators])
+        with self._lock:
+            self._companies = companies
+            self._table = table
+            self._updated_at = datetime.now().isoformat(timespec='seconds')
+
+    def table(self):
+        """Return JSON of all companies."""
+        with self._lock:
+            return self._table
+
+    def company(self, ticker):
+        """Return JSON of the company or None if the ticker is unknown."""
+        with self._lock:
+            return self._companies.get(ticker.upper())
+
+    def status(self):
+        with self._lock:
+            return self.__to_json({
+                'updated_at': self._updated_at,
+                'companies': len(self._companies),
+                'refreshing': self._refreshing,
+            })
+
+    def __run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+                logger.info(f'Indicators refreshed. Next refresh in {self._interval / 60:g} min.')
+            except Exception:
+                logger.error('Refresh of indicators failed. Previous indicators are served.', exc_info=True)
+            self._stop.wait(self._interval)
+
+    @staticmethod
+    def __to_json(value):
+        return json.dumps(value, ensure_ascii=False).encode('utf-8')
+
+
+class QueryServer:
+    """Local HTTP server of the service.
+
+    GET /indicators - all companies, GET /indicators/<ticker> - one company, GET /status - time of the last refresh,
+    GET /metrics - metrics of the scraper in Prometheus text format.
+    """
+
+    def __init__(self, service, host='127.0.0.1', port=8000):
+        self._service = service
+        self._server = ThreadingHTTPServer((host, port), self.__handler())
+        self._server.daemon_threads = True
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def shutdown(self):
+        self._server.shutdown()
+
+    def close(self):
+        self._server.server_close()
+
+    def __handler(self):
+        service = self._service
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                path = self.path.split('?', 1)[0].rstrip('/')
+                content_type = 'application/json; charset=utf-8'
+                if path == '/indicators':
+                    body = service.table()
+                elif path.startswith('/indicators/'):
+                    body = service.company(path[len('/indicators/'):])
+                elif path == '/status':
+                    body = service.status()
+                elif path == '/metrics':
+                    body = REGISTRY.to_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                else:
+                    body = None
+                if body is None:
+                    self.send_response(404)
+                    body = b'{"error": "not found"}'
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
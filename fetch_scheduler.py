@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""Scheduling of http requests: rate limit per host, retries with backoff and adaptive concurrency."""
+
+
+import random
+import threading
+import time
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+
+from telemetry import RETRIES
+
+
+# Response codes after which request is repeated
+RETRY_CODES = (requests.codes.too_many_requests, 500, 502, 503, 504)
+# Response codes and errors signaling that the site is overloaded, concurrency is reduced after them
+THROTTLE_CODES = (requests.codes.too_many_requests, requests.codes.service_unavailable)
+RETRY_EXCEPTIONS = (requests.exceptions.Timeout, requests.exceptions.ConnectionError)
+
+
+class TokenBucket:
+    """Limits the rate of requests. Allows bursts up to capacity requests."""
+
+    def __init__(self, rate, capacity=1):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Waits until the request is allowed."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """Limits the number of simultaneous requests.
+
+    The limit is halved when the site throttles requests and grows by one after a limit of successful
+    requests in a row (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, max_limit):
+        self._max_limit = max_limit
+        self._limit = max_limit
+        self._active = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def acquire(self):
+        with self._condition:
+            while self._active >= self._limit:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self, throttled=False):
+        with self._condition:
+            self._active -= 1
+            if throttled:
+                self._limit = max(1, self._limit // 2)
+                self._successes = 0
+            elif self._limit < self._max_limit:
+                self._successes += 1
+                if self._successes >= self._limit:
+                    self._limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+
+class FetchScheduler:
+    """Sends requests with rate limit per host, adaptive concurrency and retries with exponential backoff."""
+
+    def __init__(self, rate=None, burst=1, retries=3, backoff=1.0, max_backoff=60.0, max_concurrency=1):
+        self._rate = rate
+        self._burst = burst
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._limiter = AdaptiveLimiter(max_concurrency)
+        self._buckets = dict()
+        self._lock = threading.Lock()
+
+    def request(self, send, url):
+        """Call send() until a response without retry code is received or retries are exhausted.
+
+        Return the last response. The last exception is raised if no response is received.
+        """
+        for attempt in range(self._retries + 1):
+            self.__wait_turn(url)
+            self._limiter.acquire()
+            response = None
+            # Errors are taken as throttling; the slot is released after any error, not only the retried ones
+            throttled = True
+            try:
+                response = send()
+                throttled = response.status_code in THROTTLE_CODES
+            except RETRY_EXCEPTIONS as error:
+                if attempt == self._retries:
+                    raise
+                RETRIES.inc(reason=type(error).__name__)
+            else:
+                if response.status_code not in RETRY_CODES or attempt == self._retries:
+                    return response
+                RETRIES.inc(reason=response.status_code)
+            finally:
+                self._limiter.release(throttled=throttled)
+            time.sleep(self.__delay(attempt, response))
+
+    def __wait_turn(self, url):
+        if not self._rate:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self._rate, self._burst)
+        bucket.acquire()
+
+    def __delay(self, attempt, response):
+        """Pause before the next attempt: Retry-After of the response or exponential backoff with full jitter."""
+        retry_after = self.retry_after(response) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, self._max_backoff)
+        return random.uniform(0, min(self._max_backoff, self._backoff * 2 ** attempt))
+
+    @staticmethod
+    def retry_after(response):
+        """Return seconds from Retry-After header or None."""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_date.tzinfo is None:
+            retry_date = retry_date.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_date - datetime.now(timezone.utc)).total_seconds())
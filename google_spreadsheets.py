@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""Uploader to google tables."""
+
+
+import gspread
+
+from gspread.urls import SPREADSHEETS_API_V4_BASE_URL
+from gspread.utils import rowcol_to_a1
+from oauth2client.service_account import ServiceAccountCredentials
+
+from utils import Logger
+
+
+logger = Logger('scraper')
+
+
+class GoogleSpreadsheets:
+    """Class for upload lines to google table.
+
+    Lines are sent as matrices of values, no more than chunk_size lines per request. In diff mode the current
+    values of the table are read once and only the changed cells are sent.
+    """
+    def __init__(self, url_table, start_position, json_key_file, chunk_size=500, diff=False):
+        scope = ['https://spreadsheets.google.com/feeds',
+                 'https://www.googleapis.com/auth/drive']
+        credentials = ServiceAccountCredentials.from_json_keyfile_name(json_key_file, scope)
+        google_spreadsheets = gspread.authorize(credentials)
+        self._spreadsheet = google_spreadsheets.open_by_url(url_table)
+        num_list_table, self._start_row, self._start_column = start_position
+        self._worksheet = self._spreadsheet.get_worksheet(num_list_table)
+        self._chunk_size = chunk_size
+        self._diff = diff
+        self._lines = []
+
+    def upload(self):
+        """Upload lines to google table"""
+        if self._diff:
+            self.__upload_changed_cells()
+            return
+        for num_line in range(0, len(self._lines), self._chunk_size):
+            self._spreadsheet.values_update(
+                self.__range(self._start_row + num_line, self._start_column),
+                params={'valueInputOption': 'RAW'},
+                body={'values': self._lines[num_line:num_line + self._chunk_size]}
+            )
+
+    def add_line_cells(self, company_indicators):
+        """Adds cells in order on one line. And increment the number current line table by 1"""
+        self._lines.append(list(company_indicators))
+
+    def __upload_changed_cells(self):
+        """Upload only cells with values different from the table. Every run of changed cells in line is one range.
+
+        Cells of the table that have become empty and cells after the end of the shorter line are cleared.
+        """
+        # Range of the sheet title only is the whole sheet
+        current_values = self._spreadsheet.values_get(
+            self.__sheet(), params={'valueRenderOption': 'UNFORMATTED_VALUE'}
+        ).get('values', [])
+        changed_ranges = []
+        for num_row, line in enumerate(self._lines, start=self._start_row):
+            current_line = current_values[num_row - 1] if num_row <= len(current_values) else []
+            line = line + [''] * (len(current_line) - (self._start_column - 1) - len(line))
+            run_start, run_values = None, []
+            for num_col, value in enumerate(line + [None], start=self._start_column):
+                current_value = current_line[num_col - 1] if num_col <= len(current_line) else ''
+                if value is not None and not self.__same_value(value, current_value):
+                    if run_start is None:
+                        run_start = num_col
+                    run_values.append(value)
+                elif run_start is not None:
+                    changed_ranges.append({'range': self.__range(num_row, run_start), 'values': [run_values]})
+                    run_start, run_values = None, []
+
+        logger.info(f'Changed ranges in google table: {len(changed_ranges)}')
+        batch_update_url = f'{SPREADSHEETS_API_V4_BASE_URL}/{self._spreadsheet.id}/values:batchUpdate'
+        for num_range in range(0, len(changed_ranges), self._chunk_size):
+            self._spreadsheet.client.request('post', batch_update_url, json={
+                'valueInputOption': 'RAW',
+                'data': changed_ranges[num_range:num_range + self._chunk_size],
+            })
+
+    @staticmethod
+    def __same_value(value, current_value):
+        """Compare value with the table value. Numbers are compared by value: 5012.0 is the same as 5012."""
+        numbers = (int, float)
+        if isinstance(value, numbers) and isinstance(current_value, numbers):
+            return value == current_value
+        return str(value) == str(current_value)
+
+    def __sheet(self):
+        """Return A1 notation of the whole sheet."""
+        title = self._worksheet.title.replace("'", "''")
+        return f"'{title}'"
+
+    def __range(self, row, column):
+        """Return A1 notation of the range starting from the cell."""
+        return f"{self.__sheet()}!{rowcol_to_a1(row, column)}"
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""History of financial statements of all companies in one memory mapped array."""
+
+
+import json
+
+import numpy as np
+
+
+class HistoryBuilder:
+    """Collects histories of companies and saves them as one array tickers x fields x years."""
+
+    def __init__(self):
+        self._histories = dict()
+
+    def add(self, ticker, history):
+        """Add history of the company (CompanyHistory)."""
+        self._histories[ticker] = history
+
+    def save(self, path):
+        """Save array to "path.npy" and index of tickers, fields and years to "path.json"."""
+        tickers = list(self._histories)
+        fields = sorted({field for history in self._histories.values() for field in history.fields})
+        years = sorted({year for history in self._histories.values() for year in history.years})
+        field_index = {field: num for num, field in enumerate(fields)}
+        year_index = {year: num for num, year in enumerate(years)}
+
+        values = np.lib.format.open_memmap(f'{path}.npy', mode='w+', dtype=np.float64,
+                                           shape=(len(tickers), len(fields), len(years)))
+        values[:] = np.nan
+        for num_ticker, ticker in enumerate(tickers):
+            history = self._histories[ticker]
+            year_columns = [year_index[year] for year in history.years]
+            for field, field_values in history.fields.items():
+                values[num_ticker, field_index[field], year_columns] = field_values
+        values.flush()
+        del values
+
+        with open(f'{path}.json', 'w', encoding='utf-8') as index_file:
+            json.dump({'tickers': tickers, 'fields': fields, 'years': years}, index_file, ensure_ascii=False)
+
+
+class History:
+    """History saved by HistoryBuilder. The array is memory mapped, values are read from disk on access."""
+
+    def __init__(self, path):
+        with open(f'{path}.json', encoding='utf-8') as index_file:
+            index = json.load(index_file)
+        self.tickers = index['tickers']
+        self.fields = index['fields']
+        self.years = index['years']
+        self.values = np.load(f'{path}.npy', mmap_mode='r')
+        self._ticker_index = {ticker: num for num, ticker in enumerate(self.tickers)}
+        self._field_index = {field: num for num, field in enumerate(self.fields)}
+        self._year_index = {year: num for num, year in enumerate(self.years)}
+
+    def company(self, ticker):
+        """Return array fields x years of the company."""
+        return self.values[self._ticker_index[ticker]]
+
+    def field(self, field):
+        """Return array tickers x years of the indicator."""
+        return self.values[:, self._field_index[field]]
+
+    def value(self, ticker, field, year):
+        """Return value of the indicator of the company in the year. nan if the value is unknown."""
+        return float(self.values[self._ticker_index[ticker], self._field_index[field], self._year_index[year]])
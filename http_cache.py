@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""On-disk cache of downloaded html pages."""
+
+
+import threading
+import time
+import zlib
+
+from collections import namedtuple
+
+
+CachedPage = namedtuple('CachedPage', ('text', 'etag', 'last_modified', 'fetched_at'))
+
+
+class HttpCache:
+    """Stores compressed html pages in SQLite database by url.
+
+    Pages younger than ttl (seconds) are fresh and may be used without request to the site. Stale pages are
+    revalidated by conditional request with their ETag / Last-Modified headers. When the total size of the
+    compressed pages exceeds max_size (bytes), the least recently used pages are removed.
+    """
+
+    def __init__(self, path, ttl=24 * 60 * 60, max_size=100 * 1024 * 1024):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        import sqlite3
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS pages ('
+                'url TEXT PRIMARY KEY, body BLOB, etag TEXT, last_modified TEXT, '
+                'fetched_at REAL, accessed_at REAL, size INTEGER)'
+            )
+
+    def get(self, url):
+        """Return cached page or None if the page is not in cache."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT body, etag, last_modified, fetched_at FROM pages WHERE url = ?', (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            with self._connection:
+                self._connection.execute('UPDATE pages SET accessed_at = ? WHERE url = ?', (time.time(), url))
+        body, etag, last_modified, fetched_at = row
+        return CachedPage(zlib.decompress(body).decode('utf-8'), etag, last_modified, fetched_at)
+
+    def put(self, url, text, etag=None, last_modified=None):
+        """Save page to cache."""
+        body = zlib.compress(text.encode('utf-8'))
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, body, etag, last_modified, now, now, len(body))
+            )
+            self.__evict()
+
+    def refresh(self, url):
+        """Mark cached page as fresh. Used when the site responded that the page not modified."""
+        with self._lock, self._connection:
+            self._connection.execute('UPDATE pages SET fetched_at = ? WHERE url = ?', (time.time(), url))
+
+    def is_fresh(self, page):
+        """Checks that the cached page is younger than ttl."""
+        return time.time() - page.fetched_at < self._ttl
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __evict(self):
+        """Removes least recently used pages while the cache size exceeds max size."""
+        total_size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+        if total_size <= self._max_size:
+            return
+        rows = self._connection.execute('SELECT url, size FROM pages ORDER BY accessed_at DESC').fetchall()
+        kept_size = 0
+        for url, size in rows:
+            kept_size += size
+            if kept_size > self._max_size:
+                self._connection.execute('DELETE FROM pages WHERE url = ?', (url,))
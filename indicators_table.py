@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""Columnar table of financial indicators of all companies."""
+
+
+import numpy as np
+
+from metrics_collectors import CompanyIndicators
+
+
+def indicators_columns(companies_indicators, fields):
+    """Return dict field -> masked array of the numeric indicator of all companies, for IndicatorsTable.with_columns."""
+    return {
+        field: np.ma.masked_invalid(np.array([
+            value if isinstance(value, (int, float)) else np.nan
+            for value in (getattr(indicators, field) for indicators in companies_indicators)
+        ], dtype=float))
+        for field in fields
+    }
+
+
+class IndicatorsTable:
+    """Indicators of companies stored by columns.
+
+    Numeric indicators are stored in one float matrix companies x indicators. Missing values are marked in the
+    boolean mask of the same shape instead of keeping default value strings. Extra columns (dict name -> masked
+    array) are added to the end of every line, for example calculated ratios.
+    """
+    FIELDS = CompanyIndicators.NUMERIC_FIELDS
+
+    def __init__(self, tickers, names, values, mask, default_val='', extra_columns=None):
+        self.tickers = tickers
+        self.names = names
+        self.values = values
+        self.mask = mask
+        self.default_val = default_val
+        self.extra_columns = extra_columns or dict()
+        self._field_index = {field: num for num, field in enumerate(self.FIELDS)}
+
+    @classmethod
+    def from_indicators(cls, companies_indicators, default_val=''):
+        """Build table from CompanyIndicators records."""
+        companies_indicators = list(companies_indicators)
+        values = np.zeros((len(companies_indicators), len(cls.FIELDS)))
+        mask = np.ones(values.shape, dtype=bool)
+        for num_company, indicators in enumerate(companies_indicators):
+            for num_field, field in enumerate(cls.FIELDS):
+                value = getattr(indicators, field)
+                if isinstance(value, (int, float)):
+                    values[num_company, num_field] = value
+                    mask[num_company, num_field] = False
+        return cls(
+            np.array([indicators.ticker for indicators in companies_indicators], dtype=object),
+            np.array([indicators.company_name for indicators in companies_indicators], dtype=object),
+            values,
+            mask,
+            default_val,
+        )
+
+    def __len__(self):
+        return len(self.tickers)
+
+    @property
+    def header(self):
+        return CompanyIndicators.HEADER + tuple(self.extra_columns)
+
+    def column(self, field):
+        """Return masked array with values of the indicator or extra column of all companies."""
+        if field in self.extra_columns:
+            return self.extra_columns[field]
+        num_field = self._field_index[field]
+        return np.ma.MaskedArray(self.values[:, num_field], self.mask[:, num_field])
+
+    def with_columns(self, columns):
+        """Return table with extra columns added."""
+        return IndicatorsTable(self.tickers, self.names, self.values, self.mask, self.default_val,
+                               {**self.extra_columns, **columns})
+
+    def take(self, indexes):
+        """Return table with companies selected by numbers or boolean mask, in the order of indexes."""
+        return IndicatorsTable(self.tickers[indexes], self.names[indexes], self.values[indexes], self.mask[indexes],
+                               self.default_val, {name: column[indexes] for name, column in self.extra_columns.items()})
+
+    def record(self, num_company):
+        """Return CompanyIndicators of the company by its number in the table."""
+        indicators = CompanyIndicators(self.default_val,
+                                       ticker=self.tickers[num_company],
+                                       company_name=self.names[num_company])
+        for num_field, field in enumerate(self.FIELDS):
+            if not self.mask[num_company, num_field]:
+                setattr(indicators, field, float(self.values[num_company, num_field]))
+        return indicators
+
+    def lines(self):
+        """Yield table lines: one line for every type of the company stock that has price."""
+        # Company name and ticker are the first two columns, the rest are numeric indicators starting with stock price
+        stock_lines = (
+            ('', [self._field_index[field] for _, field, _ in CompanyIndicators.COLUMNS[2:]]),
+            ('P', [self._field_index[field] for _, _, field in CompanyIndicators.COLUMNS[2:]]),
+        )
+        values = self.values.tolist()
+        mask = self.mask.tolist()
+        extra_values = [column.filled(np.nan).tolist() for column in self.extra_columns.values()]
+        extra_mask = [np.ma.getmaskarray(column).tolist() for column in self.extra_columns.values()]
+        for num_company, (ticker, name) in enumerate(zip(self.tickers, self.names)):
+            extra = [
+                self.default_val if column_mask[num_company] else column_values[num_company]
+                for column_values, column_mask in zip(extra_values, extra_mask)
+            ]
+            for ticker_suffix, fields in stock_lines:
+                if mask[num_company][fields[0]]:
+                    continue
+                yield [name, ticker + ticker_suffix] + [
+                    self.default_val if mask[num_company][num_field] else values[num_company][num_field]
+                    for num_field in fields
+                ] + extra
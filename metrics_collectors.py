@@ -3,38 +3,52 @@
 """Classes for getting a list of companies and financial indicators company."""
 
 
-from collections import OrderedDict, defaultdict
-from dataclasses import dataclass
+import re
+
+from collections import OrderedDict, defaultdict, namedtuple
 from datetime import date
+from math import nan
 from statistics import mean
+from time import perf_counter
 from urllib.parse import urljoin
 
-from bs4 import BeautifulSoup
-
+from telemetry import PARSE_SECONDS
 from utils import HtmlFetcher
 
 
+# Financial table by report years: list of years and dict field -> values by years (nan for not numeric cells)
+CompanyHistory = namedtuple('CompanyHistory', ('years', 'fields'))
+# Column of the quarterly reports table, for example "2019Q4"
+QUARTER = re.compile(r'^\d{4}Q[1-4]$')
+
+
 class Companies:
     """Loads a page with a list of companies and finds tickers and stock prices."""
 
-    def __init__(self, url, ignore_list):
+    def __init__(self, url, ignore_list, parser='lxml'):
         self._url = url
         self._companies_and_stocks = defaultdict(dict)
         self._ignore_list = ignore_list
         self._downloader = HtmlFetcher()
+        # Parsers are loaded when fetching starts, not at the start of the script
+        from page_parsers import PARSERS
+        self._parser = PARSERS[parser]
 
     def fetch(self):
         """Fetching list of companies."""
-        html = self._downloader.fetch_page(self._url)
-        soup = BeautifulSoup(html, 'lxml')
-        tags_tr = soup.find('table', class_='simple-little-table trades-table').find_all('tr')
+        from page_parsers import SHARES_TABLE_CLASS
+        # Prices change during the day, so the cached list is always revalidated
+        html = self._downloader.fetch_page(self._url, until_table=SHARES_TABLE_CLASS, revalidate=True)
+        with PARSE_SECONDS.time(page='shares'):
+            rows = self._parser.parse_shares_table(html)
+        if not rows:
+            raise ValueError(f'Table with list of companies not found on page "{self._url}"')
         # Thirst row skip because this is header
-        for tag_tr in tags_tr[1:]:
-            tds = tag_tr.find_all('td')
+        for tds in rows[1:]:
             ticker = tds[3].text
-            if not tds[5].a or ticker in self._ignore_list:
+            if not tds[5].href or ticker in self._ignore_list:
                 continue
-            analysis_url = tds[5].a.get('href')
+            analysis_url = tds[5].href
             stock_type = 'ordinary stock'
             # Defines working with preferred shares
             if len(ticker) == 5:
@@ -61,12 +75,17 @@ class CompanyFinIndicators:
     """Loads a page with the financial statements of the company and finds financial indicators on it."""
     last_fin_year = None
 
-    def __init__(self, ticker, base_url, analysis_url, ordinary_stock, preference_stock=None, default_val=''):
+    def __init__(self, ticker, base_url, analysis_url, ordinary_stock, preference_stock=None, default_val='',
+                 parser='lxml'):
         if not self.last_fin_year:
             self.calc_last_fin_year()
 
         self._downloader = HtmlFetcher()
+        from page_parsers import PARSERS
+        self._parser = PARSERS[parser]
 
+        self._header = []
+        self._rows = dict()
         self._count_reports = None
         self._fresh_report = False
 
@@ -82,195 +101,312 @@ class CompanyFinIndicators:
 
     def fetch_fin_indicators(self):
         """Loads a page with the financial statements of the company and finds financial indicators on it."""
+        return self.parse_page(self.fetch_page())
+
+    def fetch_page(self):
+        """Loads a page with the financial statements of the company. Return None if the page is not loaded."""
+        try:
+            from page_parsers import FIN_TABLE_CLASS
+            return self._downloader.fetch_page(self._url, until_table=FIN_TABLE_CLASS)
+        except ConnectionError:
+            return None
+
+    def parse_page(self, page):
+        """Finds financial indicators on the page. Only stocks prices are filled if the page is None."""
         indicators = CompanyIndicators(
             default_val=self._default_val,
             ticker=self._ticker,
             ordinary_stock=self._ordinary_stock,
             preference_stock=self._preference_stock
         )
-        try:
-            page = self._downloader.fetch_page(self._url)
-        except ConnectionError:
+        if page is None:
             return indicators
 
-        soup = BeautifulSoup(page, 'lxml')
+        with PARSE_SECONDS.time(page='company'):
+            return self.__parse_page(page, indicators)
+
+    def __parse_page(self, page, indicators):
+        fin_page = self._parser.parse_fin_table(page)
+        self._header = fin_page.header
+        # Only float values of the cells are kept (default value for not numeric cells)
+        self._rows = {
+            field: [float_from_text(text, self._default_val) for text in texts]
+            for field, texts in fin_page.rows.items()
+        }
 
-        self._count_reports = self.__count_reports(soup)
-        self._fresh_report = self.__check_fresh_report(soup)
+        self._count_reports = self.__count_reports()
+        self._fresh_report = self.__check_fresh_report()
 
-        indicators.company_name = soup.find('h1').text.split('(')[0].strip()
+        indicators.company_name = fin_page.title.split('(')[0].strip()
         # чистая прибыль
-        indicators.profit = self.__find_ltm_value_in_tags_td(soup, 'net_income')
+        indicators.profit = self.__find_ltm_value('net_income')
         # средняя чистая прибыль
-        indicators.average_profit = self.__find_mean_value_in_tags_td(soup, 'net_income')
-        indicators.capitalization = self.__find_ltm_value_in_tags_td(soup, 'market_cap')
-        indicators.enterprise_value = self.__find_ltm_value_in_tags_td(soup, 'ev')
+        indicators.average_profit = self.__find_mean_value('net_income')
+        indicators.capitalization = self.__find_ltm_value('market_cap')
+        indicators.enterprise_value = self.__find_ltm_value('ev')
         # Выручка
-        indicators.proceeds = self.__find_ltm_value_in_tags_td(soup, 'revenue')
-        indicators.roe = self.__find_ltm_value_in_tags_td(soup, 'roe')
-        indicators.roa = self.__find_ltm_value_in_tags_td(soup, 'roa')
-        indicators.dividends_ordinary = self.__find_last_value_in_tags_td(soup, 'dividend')
-        indicators.dividends_preference = self.__find_last_value_in_tags_td(soup, 'dividend_pr')
+        indicators.proceeds = self.__find_ltm_value('revenue')
+        indicators.roe = self.__find_ltm_value('roe')
+        indicators.roa = self.__find_ltm_value('roa')
+        indicators.dividends_ordinary = self.__find_last_value('dividend')
+        indicators.dividends_preference = self.__find_last_value('dividend_pr')
         # Чистые активы
-        indicators.clean_assets = self.__find_ltm_value_in_tags_td(soup, 'net_assets')
+        indicators.clean_assets = self.__find_ltm_value('net_assets')
         # Балансовая стоимость
-        indicators.book_value = self.__find_ltm_value_in_tags_td(soup, 'book_value')
-        indicators.ebitda = self.__find_ltm_value_in_tags_td(soup, 'ebitda')
-        indicators.net_debt = self.__find_ltm_value_in_tags_td(soup, 'net_debt')
+        indicators.book_value = self.__find_ltm_value('book_value')
+        indicators.ebitda = self.__find_ltm_value('ebitda')
+        indicators.net_debt = self.__find_ltm_value('net_debt')
 
         return indicators
 
-    def __find_ltm_value_in_tags_td(self, soup, field):
-        tds = self.__get_row_in_table(soup, field)
-        if not tds:
+    def __find_ltm_value(self, field):
+        values = self.__get_row_values(field)
+        if not values:
             return self._default_val
 
         # Column number ltm 2 after the last column of the report self.count_reports + 2
         # The number of the last column with the report is equal to the number of reports self.count_reports
         num_ltm_column = self._count_reports + 2
         try:
-            return self.__get_float_from_text(tds[num_ltm_column].text)
+            return values[num_ltm_column]
         except IndexError:
             return self._default_val
 
-    def __find_mean_value_in_tags_td(self, soup, field):
+    def __find_mean_value(self, field):
         if not self._fresh_report:
             return self._default_val
 
-        tds = self.__get_row_in_table(soup, field)
-        if not tds:
+        values = self.__get_row_values(field)
+        if not values:
             return self._default_val
 
-        search_res = list()
         # The number of the last column with the report is equal to the number of reports self.count_reports
-        for tag_td in tds[1:self._count_reports + 1]:
-            indicator = self.__get_float_from_text(tag_td.text)
-            if indicator is self._default_val:
-                return self._default_val
-            search_res.append(indicator)
+        search_res = values[1:self._count_reports + 1]
+        if any(indicator is self._default_val for indicator in search_res):
+            return self._default_val
 
         return round(mean(search_res), 2)
 
-    def __find_last_value_in_tags_td(self, soup, field):
+    def __find_last_value(self, field):
         if not self._fresh_report:
             return self._default_val
 
-        tds = self.__get_row_in_table(soup, field)
-        if not tds:
+        values = self.__get_row_values(field)
+        if not values:
             return self._default_val
         # self.count_reports is also the last year report column number
-        return self.__get_float_from_text(tds[self._count_reports].text)
-
-    @staticmethod
-    def __get_row_in_table(soup, field):
-        try:
-            return soup.find('tr', field=field).find_all('td')
-        except AttributeError:
-            return
-
-    def __check_fresh_report(self, soup):
+        return values[self._count_reports]
+
+    def history(self):
+        """Return all rows of the parsed table by report years."""
+        year_columns = [(num_column, int(text)) for num_column, text in enumerate(self._header) if text.isdigit()]
+        fields = dict()
+        for field, values in self._rows.items():
+            fields[field] = [
+                values[num_column]
+                if num_column < len(values) and values[num_column] is not self._default_val else nan
+                for num_column, _ in year_columns
+            ]
+        return CompanyHistory([year for _, year in year_columns], fields)
+
+    def __get_row_values(self, field):
+        return self._rows.get(field, [])
+
+    def __check_fresh_report(self):
         """Checks the report for freshness."""
         try:
-            year_last_report = int(soup.find('tr', class_='header_row').find_all('td')[self._count_reports].text)
-        except ValueError:
+            year_last_report = int(self._header[self._count_reports])
+        except (ValueError, IndexError):
             return False
 
         if self.last_fin_year > year_last_report:
             return False
         return True
 
-    def __get_float_from_text(self, text):
-        """Getting float value from string."""
-        try:
-            return float(text.strip().replace(' ', '').replace('%', ''))
-        except ValueError:
-            return self._default_val
-
-    @staticmethod
-    def __count_reports(soup):
+    def __count_reports(self):
         """Counts the number of financial reports."""
-        tags_td = soup.find('tr', class_='header_row').find_all('td')
         count = 0
-        for tag in tags_td:
-            if tag.text.isdigit():
+        for text in self._header:
+            if text.isdigit():
                 count += 1
         return count
 
     @classmethod
-    def calc_last_fin_year(cls):
-        """Last fiscal year calculate. Year select about 1 july."""
-        today = date.today()
+    def calc_last_fin_year(cls, today=None):
+        """Last fiscal year calculate. Year select about 1 july. Today is used if the date is not given."""
+        today = today or date.today()
         if today.month < date(1, 7, 1).month:
             cls.last_fin_year = today.year - 2
         else:
             cls.last_fin_year = today.year - 1
 
 
-@dataclass(repr=False, eq=False, order=False)
+class CompanyQuarterlyReports:
+    """Loads a page with the quarterly reports of the company and finds indicators of the last quarters."""
+    # Indicators of the last quarter and sums of the last four quarters by rows of the table
+    ROWS = (
+        ('net_income', 'quarter_profit', 'profit_4q'),
+        ('revenue', 'quarter_proceeds', 'proceeds_4q'),
+    )
+    FIELDS = tuple(field for _, last_field, sum_field in ROWS for field in (last_field, sum_field))
+
+    def __init__(self, base_url, analysis_url, default_val='', parser='lxml'):
+        self._downloader = HtmlFetcher()
+        from page_parsers import PARSERS
+        self._parser = PARSERS[parser]
+        self._default_val = default_val
+        # Page of quarterly reports differs from the page of annual reports in the last part: /q/SBER/f/q/
+        if analysis_url and analysis_url.endswith('/y/'):
+            self._url = urljoin(base_url, analysis_url[:-len('y/')] + 'q/')
+        else:
+            self._url = ''
+
+    def fetch_page(self):
+        """Loads a page with the quarterly reports of the company. Return None if the page is not loaded."""
+        if not self._url:
+            return None
+        try:
+            from page_parsers import FIN_TABLE_CLASS
+            return self._downloader.fetch_page(self._url, until_table=FIN_TABLE_CLASS)
+        except ConnectionError:
+            return None
+
+    def parse_page(self, page):
+        """Return dict indicator -> value of the last quarters. Values are default if the page is None."""
+        quarters = dict.fromkeys(self.FIELDS, self._default_val)
+        if page is None:
+            return quarters
+
+        with PARSE_SECONDS.time(page='quarterly'):
+            fin_page = self._parser.parse_fin_table(page)
+        columns = [num_column for num_column, text in enumerate(fin_page.header) if QUARTER.match(text.strip())]
+        if not columns:
+            return quarters
+        for row_field, last_field, sum_field in self.ROWS:
+            texts = fin_page.rows.get(row_field)
+            if not texts:
+                continue
+            values = [float_from_text(texts[num_column], self._default_val) if num_column < len(texts)
+                      else self._default_val for num_column in columns]
+            quarters[last_field] = values[-1]
+            last_year = values[-4:]
+            if len(last_year) == 4 and not any(value is self._default_val for value in last_year):
+                quarters[sum_field] = round(sum(last_year), 2)
+        return quarters
+
+
+def float_from_text(text, default_val=''):
+    """Getting float value from string. Return default_val if the text is not a number."""
+    try:
+        return float(text.strip().replace(' ', '').replace('%', ''))
+    except ValueError:
+        return default_val
+
+
+def init_parse_worker(last_fin_year):
+    """Initialize process of the parse pool with the last fiscal year of the main process."""
+    CompanyFinIndicators.last_fin_year = last_fin_year
+
+
+def parse_company_page(company_information, page, history=False):
+    """Parse the page in the process of the parse pool.
+
+    Return indicators, history (or None) and parse seconds. Only these compact records are sent back to the main
+    process.
+    """
+    start = perf_counter()
+    indicators = company_information.parse_page(page)
+    company_history = company_information.history() if history else None
+    return indicators, company_history, perf_counter() - start
+
+
+def parse_quarterly_page(reports, page):
+    """Parse the page of quarterly reports in the process of the parse pool.
+
+    Return dict indicator -> value and parse seconds.
+    """
+    start = perf_counter()
+    quarters = reports.parse_page(page)
+    return quarters, perf_counter() - start
+
+
 class CompanyIndicators:
-    default_val: str = ''
-
-    ticker: str = default_val
-    ordinary_stock: str = default_val
-    preference_stock: str = default_val
-
-    company_name: str = default_val
-    profit: str = default_val
-    average_profit: str = default_val
-    capitalization: str = default_val
-    dividends_ordinary: str = default_val
-    dividends_preference: str = default_val
-    # стоимость предприятия - EV
-    enterprise_value: str = default_val
-    # чистые активы
-    clean_assets: str = default_val
-    # балансовая стоимость
-    book_value: str = default_val
-    ebitda: str = default_val
-    net_debt: str = default_val
-    proceeds: str = default_val
-    roe: str = default_val
-    roa: str = default_val
+    """Financial indicators of the company. Missing indicators are equal to default_val."""
+    __slots__ = (
+        'default_val',
+        'ticker',
+        'ordinary_stock',
+        'preference_stock',
+        'company_name',
+        'profit',
+        'average_profit',
+        'capitalization',
+        'dividends_ordinary',
+        'dividends_preference',
+        # стоимость предприятия - EV
+        'enterprise_value',
+        # чистые активы
+        'clean_assets',
+        # балансовая стоимость
+        'book_value',
+        'ebitda',
+        'net_debt',
+        'proceeds',
+        'roe',
+        'roa',
+        # Indicators of the quarterly reports: the last quarter and the sum of the last four quarters. They are not in
+        # the table columns and are added to the table as extra columns with --quarterly
+        'quarter_profit',
+        'profit_4q',
+        'quarter_proceeds',
+        'proceeds_4q',
+    )
+    # Indicators with float values
+    NUMERIC_FIELDS = (
+        'ordinary_stock', 'preference_stock', 'profit', 'average_profit', 'capitalization', 'dividends_ordinary',
+        'dividends_preference', 'enterprise_value', 'clean_assets', 'book_value', 'ebitda', 'net_debt', 'proceeds',
+        'roe', 'roa',
+    )
+    # Table columns: column name and attributes for ordinary and preference stock lines
+    COLUMNS = (
+        ('company name', 'company_name', 'company_name'),
+        ('ticker', 'ticker', 'ticker'),
+        ('stock', 'ordinary_stock', 'preference_stock'),
+        ('profit', 'profit', 'profit'),
+        ('average profit', 'average_profit', 'average_profit'),
+        ('capitalization', 'capitalization', 'capitalization'),
+        ('enterprise value', 'enterprise_value', 'enterprise_value'),
+        ('clean assets', 'clean_assets', 'clean_assets'),
+        ('book value', 'book_value', 'book_value'),
+        ('ebitda', 'ebitda', 'ebitda'),
+        ('net_debt', 'net_debt', 'net_debt'),
+        ('dividends', 'dividends_ordinary', 'dividends_preference'),
+        ('proceeds', 'proceeds', 'proceeds'),
+        ('roe', 'roe', 'roe'),
+        ('roa', 'roa', 'roa'),
+    )
+    HEADER = tuple(column for column, _, _ in COLUMNS)
+
+    def __init__(self, default_val='', **indicators):
+        self.default_val = default_val
+        for field in self.__slots__[1:]:
+            setattr(self, field, indicators.pop(field, default_val))
+        if indicators:
+            raise TypeError(f'Unknown indicators: {", ".join(indicators)}')
+
+    def to_dict(self):
+        """Return dict field -> value."""
+        return {field: getattr(self, field) for field in self.__slots__}
 
     @property
     def indicators_ordinary(self):
         """Return order dict with finance indicators and ordinary stock."""
-        return OrderedDict([
-            ('company name', self.company_name),
-            ('ticker', self.ticker),
-            ('stock', self.ordinary_stock),
-            ('profit', self.profit),
-            ('average profit', self.average_profit),
-            ('capitalization', self.capitalization),
-            ('enterprise value', self.enterprise_value),
-            ('clean assets', self.clean_assets),
-            ('book value', self.book_value),
-            ('ebitda', self.ebitda),
-            ('net_debt', self.net_debt),
-            ('dividends', self.dividends_ordinary),
-            ('proceeds', self.proceeds),
-            ('roe', self.roe),
-            ('roa', self.roa),
-        ])
+        return OrderedDict((column, getattr(self, field)) for column, field, _ in self.COLUMNS)
 
     @property
     def indicators_preference(self):
         """Return order dict with finance indicators and preference stock."""
-        return OrderedDict([
-            ('company name', self.company_name),
-            # + 'P" because this preference stock
-            ('ticker', self.ticker + 'P'),
-            ('stock', self.preference_stock),
-            ('profit', self.profit),
-            ('average profit', self.average_profit),
-            ('capitalization', self.capitalization),
-            ('enterprise value', self.enterprise_value),
-            ('clean assets', self.clean_assets),
-            ('book value', self.book_value),
-            ('ebitda', self.ebitda),
-            ('net_debt', self.net_debt),
-            ('dividends', self.dividends_preference),
-            ('proceeds', self.proceeds),
-            ('roe', self.roe),
-            ('roa', self.roa),
-        ])
+        indicators = OrderedDict((column, getattr(self, field)) for column, _, field in self.COLUMNS)
+        # + 'P" because this preference stock
+        indicators['ticker'] += 'P'
+        return indicators
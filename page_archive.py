@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""Append-only archive of downloaded html pages."""
+
+
+import threading
+import time
+import zlib
+
+from collections import namedtuple
+
+from snapshot_store import content_hash
+
+
+# Archived page: url, text and time of download (seconds since the epoch)
+ArchivedPage = namedtuple('ArchivedPage', ('url', 'text', 'fetched_at'))
+
+
+class PageArchive:
+    """Stores every downloaded page in SQLite database. Pages are never updated or removed.
+
+    Pages are grouped by snapshots: one snapshot is one run of the scraper. Bodies are compressed and stored
+    once by the hash of the content, so unchanged pages of the next snapshots take only a line of the index.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        import sqlite3
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS snapshots (snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT, started_at REAL)'
+            )
+            self._connection.execute('CREATE TABLE IF NOT EXISTS bodies (content_hash TEXT PRIMARY KEY, body BLOB)')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS pages (snapshot_id INTEGER, url TEXT, fetched_at REAL, content_hash TEXT)'
+            )
+            self._connection.execute('CREATE INDEX IF NOT EXISTS pages_url ON pages (url, fetched_at)')
+
+    def start_snapshot(self):
+        """Register new snapshot and return its id."""
+        with self._lock, self._connection:
+            cursor = self._connection.execute('INSERT INTO snapshots (started_at) VALUES (?)', (time.time(),))
+        return cursor.lastrowid
+
+    def snapshots(self):
+        """Return list of pairs (snapshot id, start time) from oldest to newest."""
+        with self._lock:
+            return self._connection.execute(
+                'SELECT snapshot_id, started_at FROM snapshots ORDER BY snapshot_id'
+            ).fetchall()
+
+    def resolve_snapshot(self, snapshot_id):
+        """Return pair (snapshot id, start time). Negative numbers count snapshots from the end: -1 is the last one."""
+        snapshots = self.snapshots()
+        if snapshot_id < 0:
+            try:
+                return snapshots[snapshot_id]
+            except IndexError:
+                raise ValueError(f'Snapshot {snapshot_id} not found in archive')
+        for snapshot in snapshots:
+            if snapshot[0] == snapshot_id:
+                return snapshot
+        raise ValueError(f'Snapshot {snapshot_id} not found in archive')
+
+    def put(self, snapshot_id, url, text):
+        """Append page to the snapshot."""
+        page_hash = content_hash(text)
+        with self._lock, self._connection:
+            if not self._connection.execute('SELECT 1 FROM bodies WHERE content_hash = ?', (page_hash,)).fetchone():
+                self._connection.execute(
+                    'INSERT INTO bodies VALUES (?, ?)', (page_hash, zlib.compress(text.encode('utf-8')))
+                )
+            self._connection.execute(
+                'INSERT INTO pages VALUES (?, ?, ?, ?)', (snapshot_id, url, time.time(), page_hash)
+            )
+
+    def get(self, url, snapshot_id=None, before=None):
+        """Return the latest page of url in the snapshot (any snapshot if None) downloaded before the time.
+
+        Return None if the page is not in archive.
+        """
+        query = ('SELECT p.fetched_at, b.body FROM pages p JOIN bodies b ON p.content_hash = b.content_hash '
+                 'WHERE p.url = ?')
+        args = [url]
+        if snapshot_id is not None:
+            query += ' AND p.snapshot_id = ?'
+            args.append(snapshot_id)
+        if before is not None:
+            query += ' AND p.fetched_at < ?'
+            args.append(before)
+        query += ' ORDER BY p.fetched_at DESC LIMIT 1'
+        with self._lock:
+            row = self._connection.execute(query, args).fetchone()
+        if row is None:
+            return None
+        fetched_at, body = row
+        return ArchivedPage(url, zlib.decompress(body).decode('utf-8'), fetched_at)
+
+    def urls(self, snapshot_id):
+        """Return list of urls archived in the snapshot."""
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT DISTINCT url FROM pages WHERE snapshot_id = ? ORDER BY url', (snapshot_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""Parsers of smart-lab pages. Extract from a page only the table rows and the title used by collectors."""
+
+
+import re
+
+from collections import namedtuple
+
+from lxml import etree
+
+
+SHARES_TABLE_CLASS = 'simple-little-table trades-table'
+FIN_TABLE_CLASS = 'simple-little-table financials'
+TABLE_TAG = re.compile(r'<(/?)table\b([^>]*)>', re.IGNORECASE)
+CLASS_ATTRIBUTE = re.compile(r'\bclass\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))', re.IGNORECASE)
+
+# Table cell: text and link from the first <a> tag in the cell (None if the cell has no link)
+Cell = namedtuple('Cell', ('text', 'href'))
+# Company financial page: text of <h1>, texts of the header row, dict field -> texts of the first row with field
+FinPage = namedtuple('FinPage', ('title', 'header', 'rows'))
+
+
+class SoupPageParser:
+    """Builds full BeautifulSoup tree of the page. BeautifulSoup is imported on the first use."""
+
+    @staticmethod
+    def parse_shares_table(html):
+        """Return rows of the table with list of companies. Each row is list of cells."""
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'lxml')
+        table = soup.find('table', class_=SHARES_TABLE_CLASS)
+        if not table:
+            return []
+        return [
+            [Cell(tag_td.text, tag_td.a.get('href') if tag_td.a else None) for tag_td in tag_tr.find_all('td')]
+            for tag_tr in table.find_all('tr')
+        ]
+
+    @staticmethod
+    def parse_fin_table(html):
+        """Return title, header and rows of the table with financial statements."""
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'lxml')
+        tag_h1 = soup.find('h1')
+        header = None
+        rows = dict()
+        for tag_tr in soup.find_all('tr'):
+            if header is None and 'header_row' in tag_tr.get('class', ()):
+                header = [tag_td.text for tag_td in tag_tr.find_all('td')]
+            field = tag_tr.get('field')
+            if field and field not in rows:
+                rows[field] = [tag_td.text for tag_td in tag_tr.find_all('td')]
+        return FinPage(tag_h1.text if tag_h1 else '', header or [], rows)
+
+
+class LxmlPageParser:
+    """Parses the page incrementally with lxml. Keeps in memory only the first <h1> and table rows.
+
+    Every other element is removed from the tree as soon as it has been parsed, so the whole page tree
+    is never built.
+    """
+
+    def __init__(self, table_class=None):
+        self._parser = etree.HTMLPullParser(events=('start', 'end'))
+        # Rows are collected only from the first table with this class. None - rows from the whole page.
+        self._table_class = table_class
+        self._table = None
+        self._open_tags = 0
+        self.title = None
+        self.rows = []
+        self.table_closed = False
+
+    def feed(self, data):
+        """Parse next part of the page."""
+        self._parser.feed(data)
+        self.__read_events()
+
+    def close(self):
+        """Finish parsing of the page."""
+        self._parser.close()
+        self.__read_events()
+
+    def __read_events(self):
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                if element.tag in ('tr', 'h1'):
+                    self._open_tags += 1
+                elif element.tag == 'table' and self._table is None and not self.table_closed \
+                        and self._table_class and element.get('class') == self._table_class:
+                    self._table = element
+                continue
+
+            if element.tag == 'h1':
+                self._open_tags -= 1
+                if self.title is None:
+                    self.title = self.__text(element)
+            elif element.tag == 'tr':
+                self._open_tags -= 1
+                if self._table_class is None or self._table is not None:
+                    self.rows.append((dict(element.attrib), [
+                        Cell(self.__text(tag_td), next((tag_a.get('href') for tag_a in tag_td.iter('a')), None))
+                        for tag_td in element.iter('td')
+                    ]))
+            elif element is self._table:
+                self._table = None
+                self.table_closed = True
+
+            # Text of the tags inside <h1> and <tr> is read when the parent tag closes
+            if not self._open_tags:
+                self.__drop(element)
+
+    @staticmethod
+    def __text(element):
+        return ''.join(element.itertext())
+
+    @staticmethod
+    def __drop(element):
+        """Removes parsed element and its previous siblings from the tree."""
+        element.clear()
+        parent = element.getparent()
+        if parent is None:
+            return
+        while element.getprevious() is not None:
+            del parent[0]
+
+    @classmethod
+    def parse_shares_table(cls, html):
+        """Return rows of the table with list of companies. Each row is list of cells."""
+        parser = cls(table_class=SHARES_TABLE_CLASS)
+        parser.feed(html)
+        parser.close()
+        return [cells for _, cells in parser.rows]
+
+    @classmethod
+    def parse_fin_table(cls, html):
+        """Return title, header and rows of the table with financial statements."""
+        parser = cls()
+        parser.feed(html)
+        parser.close()
+        header = None
+        rows = dict()
+        for attrib, cells in parser.rows:
+            if header is None and 'header_row' in attrib.get('class', '').split():
+                header = [cell.text for cell in cells]
+            field = attrib.get('field')
+            if field and field not in rows:
+                rows[field] = [cell.text for cell in cells]
+        return FinPage(parser.title or '', header or [], rows)
+
+
+class TableEndDetector:
+    """Finds the end of the first table with the class in the page fed by parts.
+
+    Only <table> tags are scanned, nested tables are counted. Pull parser of lxml is not used here: it stops emitting
+    events on some pages fed by parts.
+    """
+
+    def __init__(self, table_class):
+        self._table_class = table_class
+        # Tables opened from the start of the table with the class; 0 - the table has not been found yet
+        self._depth = 0
+        self._tail = ''
+        self.table_closed = False
+
+    def feed(self, data):
+        """Scan next part of the page. Return True if the table has been closed."""
+        if self.table_closed:
+            return True
+        text = self._tail + data
+        end = 0
+        for match in TABLE_TAG.finditer(text):
+            end = match.end()
+            if match.group(1):
+                if self._depth:
+                    self._depth -= 1
+                    self.table_closed = not self._depth
+                    if self.table_closed:
+                        return True
+            elif self._depth:
+                self._depth += 1
+            elif self.__tag_class(match.group(2)) == self._table_class:
+                self._depth = 1
+        # Tag cut by the end of the part is scanned with the next part
+        start = text.rfind('<', end)
+        self._tail = text[start:] if start >= 0 else ''
+        return False
+
+    @staticmethod
+    def __tag_class(attributes):
+        match = CLASS_ATTRIBUTE.search(attributes)
+        if not match:
+            return None
+        return next(value for value in match.groups() if value is not None)
+
+
+PARSERS = {
+    'soup': SoupPageParser,
+    'lxml': LxmlPageParser,
+}
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+"""Profiling of the scraper stages: CPU time of functions with cProfile and memory allocations with tracemalloc."""
+
+
+import io
+import os
+import threading
+
+from contextlib import contextmanager, nullcontext
+
+
+# Context of every stage while profiling is off
+NO_PROFILE = nullcontext()
+
+
+class StageMemory:
+    """Memory traced while the stage runs. Stage running in several threads is traced as one window."""
+
+    def __init__(self):
+        self.active = 0
+        self.start_size = 0
+        self.start_snapshot = None
+        self.growth = 0
+        self.peak = 0
+        # traceback -> [size difference, count difference] of memory blocks allocated there
+        self.allocations = dict()
+
+
+class StageProfiler:
+    """Collects CPU profile and memory allocations of every stage of the run.
+
+    Every thread running the stage has its own cProfile profiler, profiles of the stage are merged. Python 3.12+
+    allows one active profiler in the process, which sees the calls of all threads: a thread entering the stage while
+    another profiler is active is not profiled separately. Memory is traced from the first thread entering the stage
+    to the last thread leaving it. Until enable() is called stage() returns the same empty context and profiling
+    modules are not imported.
+    """
+
+    def __init__(self, top=30):
+        self._top = top
+        self._enabled = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = dict()
+        self._memory = dict()
+        self._open_windows = 0
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    def enable(self, frames=1):
+        """Start profiling. frames - number of frames saved for every allocation."""
+        import tracemalloc
+        tracemalloc.start(frames)
+        self._enabled = True
+
+    def disable(self):
+        import tracemalloc
+        self._enabled = False
+        tracemalloc.stop()
+
+    def stage(self, name):
+        """Return context manager profiling the code of the stage in the current thread."""
+        if not self._enabled:
+            return NO_PROFILE
+        return self.__profile(name)
+
+    def save(self, directory):
+        """Write profile and report of every stage and profile of all stages (profile.prof) to the directory."""
+        import pstats
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        with self._lock:
+            for name, stats in self._stats.items():
+                path = os.path.join(directory, f'{name}.prof')
+                stats.dump_stats(path)
+                paths.append(path)
+                with open(os.path.join(directory, f'{name}.txt'), 'w', encoding='utf-8') as report_file:
+                    report_file.write(self.__report(name, path))
+        if paths:
+            pstats.Stats(*paths).dump_stats(os.path.join(directory, 'profile.prof'))
+
+    @contextmanager
+    def __profile(self, name):
+        if getattr(self._local, 'stage', None) is not None:
+            # Nested stage is profiled as a part of the outer one
+            yield
+            return
+        import cProfile
+        import pstats
+        self._local.stage = name
+        self.__enter_memory(name)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active (Python 3.12+)
+            profile = None
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            self._local.stage = None
+            self.__exit_memory(name)
+            if profile is not None:
+                with self._lock:
+                    if name in self._stats:
+                        self._stats[name].add(profile)
+                    else:
+                        self._stats[name] = pstats.Stats(profile)
+
+    def __enter_memory(self, name):
+        import tracemalloc
+        with self._lock:
+            memory = self._memory.setdefault(name, StageMemory())
+            memory.active += 1
+            if memory.active > 1:
+                return
+            # Peak is shared by the stages running at the same time. Before Python 3.9 it is the peak since enable()
+            if not self._open_windows and hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            self._open_windows += 1
+            memory.start_size = tracemalloc.get_traced_memory()[0]
+            memory.start_snapshot = self.__snapshot()
+
+    def __exit_memory(self, name):
+        import tracemalloc
+        with self._lock:
+            memory = self._memory[name]
+            memory.active -= 1
+            if memory.active:
+                return
+            self._open_windows -= 1
+            size, peak = tracemalloc.get_traced_memory()
+            memory.peak = max(memory.peak, peak)
+            memory.growth += size - memory.start_size
+            for difference in self.__snapshot().compare_to(memory.start_snapshot, 'lineno'):
+                totals = memory.allocations.setdefault(difference.traceback, [0, 0])
+                totals[0] += difference.size_diff
+                totals[1] += difference.count_diff
+            memory.start_snapshot = None
+
+    @staticmethod
+    def __snapshot():
+        """Return snapshot of traced memory without allocations of the profiler itself."""
+        import cProfile
+        import pstats
+        import tracemalloc
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, module.__file__) for module in (cProfile, pstats, tracemalloc)]
+            + [tracemalloc.Filter(False, __file__)]
+        )
+
+    def __report(self, name, profile_path):
+        import pstats
+        lines = [f'Stage: {name}']
+        memory = self._memory.get(name)
+        if memory:
+            lines.append(f'Peak traced memory: {self.__size(memory.peak)}, growth: {self.__size(memory.growth)}')
+            lines.append('')
+            lines.append('Top allocation sites (size and number of blocks left after the stage):')
+            allocations = sorted(memory.allocations.items(), key=lambda item: item[1][0], reverse=True)
+            for traceback, (size, count) in allocations[:self._top]:
+                lines.append(f'{self.__size(size):>12} {count:>8}  {traceback}')
+        lines.append('')
+        lines.append('Top functions by cumulative time:')
+        stream = io.StringIO()
+        pstats.Stats(profile_path, stream=stream).sort_stats('cumulative').print_stats(self._top)
+        lines.append(stream.getvalue())
+        return '\n'.join(lines)
+
+    @staticmethod
+    def __size(size):
+        return f'{size / 1024 / 1024:.2f} MB' if abs(size) >= 1024 * 1024 else f'{size / 1024:.1f} KB'
+
+
+PROFILER = StageProfiler()
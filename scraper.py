@@ -2,67 +2,604 @@
 
 """Script for getting a list of companies and their financial indicators from https://smart-lab.ru/."""
 
+import multiprocessing
+import os
 import re
 
-from collections import namedtuple
+from collections import deque, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime
+from itertools import islice
+from urllib.parse import urljoin
 
-from uploaders import save_to_file, save_to_google_spreadsheets
-from utils import get_arg_params, Logger
-from metrics_collectors import Companies, CompanyFinIndicators
+from checkpoint import CheckpointJournal
+from fetch_scheduler import FetchScheduler
+from http_cache import HttpCache
+from page_archive import PageArchive
+from profiling import PROFILER
+from snapshot_store import content_hash, SnapshotStore
+from telemetry import PARSE_SECONDS, REGISTRY
+from sinks import CsvSink, FanOut, GoogleSpreadsheetsSink, JsonLinesSink, SqliteSink
+from uploaders import indicators_lines, save_changes_to_file
+from utils import get_arg_params, HtmlFetcher, Logger
+from metrics_collectors import (Companies, CompanyFinIndicators, CompanyIndicators, CompanyQuarterlyReports,
+                                init_parse_worker, parse_company_page, parse_quarterly_page)
 
 
-logger = Logger('scraper')
-logger.set_logs('console')
-logger.set_logs('file', logs_directory='.')
+# Result of fetching one company: indicators, hash of the company page and history (CompanyHistory or None)
+FetchResult = namedtuple('FetchResult', ('indicators', 'page_hash', 'history'))
+
+logger = Logger('scraper', queued=True)
+
+
+def fetch_company_page(company, indicators, site_url, default_cell_val, parser='lxml', snapshot=None, history=False,
+                       quarterly=False):
+    """Download the page of one company. Return collector of the company, page, hash of the page, indicators and
+    the page of quarterly reports.
+
+    If the page has not changed since the snapshot, indicators are taken from the snapshot with current stocks prices,
+    otherwise indicators are None and the page should be parsed. If quarterly is True, the page of quarterly reports
+    is downloaded right after the page by the same thread, so both pages go through the connections of the thread
+    session. It is returned as pair (CompanyQuarterlyReports, page), otherwise None.
+    """
+    ordinary_stock = indicators.get('ordinary stock', default_cell_val)
+    preference_stock = indicators.get('preference stock', default_cell_val)
+    with PROFILER.stage('company_pages'):
+        company_information = CompanyFinIndicators(company, site_url, indicators['analysis_url'],
+                                                   ordinary_stock, preference_stock, default_cell_val, parser)
+        page = company_information.fetch_page()
+        page_hash = content_hash(page)
+        quarterly_page = fetch_quarterly_page(company, indicators, site_url, default_cell_val, parser) \
+            if quarterly else None
+    company_indicators = None
+    if snapshot and not history and page_hash and snapshot.content_hash == page_hash:
+        company_indicators = snapshot.indicators
+        company_indicators.ordinary_stock = ordinary_stock
+        company_indicators.preference_stock = preference_stock
+    return company_information, page, page_hash, company_indicators, quarterly_page
+
+
+def fetch_quarterly_page(company, indicators, site_url, default_cell_val, parser='lxml'):
+    """Download the page of quarterly reports of one company. Return pair (CompanyQuarterlyReports, page).
+
+    Error of the quarterly reports does not fail the company: the page is None and its quarterly indicators are left
+    empty.
+    """
+    reports = CompanyQuarterlyReports(site_url, indicators['analysis_url'], default_cell_val, parser)
+    try:
+        return reports, reports.fetch_page()
+    except Exception as error:
+        logger.warning(f'Failed to get quarterly reports of {company}: {error}')
+        return reports, None
+
+
+def stocks_indicators(company, indicators, default_cell_val):
+    """Return indicators of the company with stocks prices only."""
+    return CompanyIndicators(default_val=default_cell_val,
+                             ticker=company,
+                             ordinary_stock=indicators.get('ordinary stock', default_cell_val),
+                             preference_stock=indicators.get('preference stock', default_cell_val))
+
+
+def fetch_company_indicators(company, indicators, site_url, default_cell_val, parser='lxml', snapshot=None,
+                             history=False, quarterly=False):
+    """Fetch financial indicators of one company. Return FetchResult.
+
+    If the page has not changed since the snapshot, indicators are taken from the snapshot with current stocks prices.
+    If history is True, all rows of the financial table by years are returned too. If quarterly is True, indicators
+    of the quarterly reports are added to the indicators.
+    """
+    with PROFILER.stage('company_pages'):
+        company_information, page, page_hash, company_indicators, quarterly_page = fetch_company_page(
+            company, indicators, site_url, default_cell_val, parser, snapshot, history, quarterly
+        )
+        if company_indicators is None:
+            company_indicators = company_information.parse_page(page)
+        if quarterly_page is not None:
+            try:
+                quarters = quarterly_page[0].parse_page(quarterly_page[1])
+            except Exception as error:
+                logger.warning(f'Failed to get quarterly reports of {company}: {error}')
+                quarters = dict()
+            for field, value in quarters.items():
+                setattr(company_indicators, field, value)
+    return FetchResult(company_indicators, page_hash, company_information.history() if history else None)
+
+
+def submit_company_indicators(fetch_executor, parse_executor, fetch_args, history=False, quarterly=False):
+    """Download the pages of one company in the fetch executor and parse them in the process pool parse executor.
+
+    Return future of FetchResult. Downloaded pages are passed to the parse executor as soon as they are fetched.
+    """
+    company = fetch_args[0]
+    result = Future()
+
+    def parse(company_information, page, page_hash, company_indicators):
+        """Return future of FetchResult of the annual page."""
+        annual = Future()
+        annual.set_running_or_notify_cancel()
+        if company_indicators is not None:
+            annual.set_result(FetchResult(company_indicators, page_hash, None))
+            return annual
+
+        def parsed(parse_future):
+            try:
+                company_indicators, company_history, parse_seconds = parse_future.result()
+            except BaseException as error:
+                annual.set_exception(error)
+                return
+            PARSE_SECONDS.observe(parse_seconds, page='company')
+            annual.set_result(FetchResult(company_indicators, page_hash, company_history))
+
+        parse_executor.submit(parse_company_page, company_information, page, history).add_done_callback(parsed)
+        return annual
+
+    def done(future):
+        try:
+            result.set_result(future.result())
+        except BaseException as error:
+            result.set_exception(error)
+
+    def fetched(fetch_future):
+        if not result.set_running_or_notify_cancel():
+            return
+        try:
+            company_information, page, page_hash, company_indicators, quarterly_page = fetch_future.result()
+            parsed_future = parse(company_information, page, page_hash, company_indicators)
+            if quarterly_page is not None:
+                parsed_future = with_quarters(company, parsed_future,
+                                              parse_executor.submit(parse_quarterly_page, *quarterly_page))
+        except BaseException as error:
+            result.set_exception(error)
+            return
+        parsed_future.add_done_callback(done)
+
+    fetch_executor.submit(fetch_company_page, *fetch_args, history, quarterly).add_done_callback(fetched)
+    return result
+
+
+def with_quarters(company, result_future, quarters_future):
+    """Return future of FetchResult with the indicators of the quarterly reports added to the indicators.
+
+    quarters_future - future of the pair (dict indicator -> value, parse seconds) from the parse pool. Error of the
+    quarterly reports does not fail the company, its quarterly indicators are left empty.
+    """
+    result = Future()
+
+    def combine(annual, quarterly):
+        if not result.set_running_or_notify_cancel():
+            return
+        try:
+            fetch_result = annual.result()
+        except BaseException as error:
+            result.set_exception(error)
+            return
+        try:
+            quarters, parse_seconds = quarterly.result()
+            PARSE_SECONDS.observe(parse_seconds, page='quarterly')
+        except Exception as error:
+            logger.warning(f'Failed to get quarterly reports of {company}: {error}')
+            quarters = dict()
+        for field, value in quarters.items():
+            setattr(fetch_result.indicators, field, value)
+        result.set_result(fetch_result)
+
+    result_future.add_done_callback(
+        lambda annual: quarters_future.add_done_callback(lambda quarterly: combine(annual, quarterly))
+    )
+    return result
+
+
+def iter_companies_indicators(companies_list, site_url, default_cell_val, workers=1, parser='lxml',
+                              store=None, incremental=False, history_builder=None, parse_workers=0, executor=None,
+                              journal=None, quarterly=False):
+    """Fetch financial indicators of all companies. Yield pairs (company, indicators) in the order of companies list.
+
+    No more than 2 * max(workers, parse_workers) companies are fetched ahead of the consumer, so a slow consumer
+    holds back fetching. If parse_workers is given, pages are downloaded by workers threads and parsed by
+    parse_workers processes, otherwise pages are parsed in the downloading threads.
+    If store is given, indicators are saved in the store as a new run. In incremental mode only companies whose
+    pages have changed since the last run are parsed. If history_builder is given, all rows of the financial
+    tables by years are added to it. If executor is given, pages are downloaded by its threads and their HTTP
+    sessions stay open after the fetching.
+    Companies whose pages are not loaded or not parsed are fetched once more after the others and yielded last,
+    if they fail again only stocks prices are filled. If journal is given, companies completed in the previous run
+    are taken from it and completed companies are recorded to it.
+    If quarterly is True, the page of quarterly reports of every company is downloaded by the same thread right after
+    the page of annual reports and is parsed where the annual page is parsed.
+    """
+    snapshots = store.last_snapshots() if store and incremental else dict()
+    run_id = store.start_run() if store else None
+    history = history_builder is not None
+    window = 2 * max(workers, parse_workers)
+    completed = journal.completed() if journal else dict()
+
+    def finish(company, result):
+        company_indicators, page_hash, company_history = result
+        if store:
+            store.save(run_id, company_indicators, page_hash)
+        if history and company_history is not None:
+            history_builder.add(company, company_history)
+        if journal and page_hash:
+            journal.record(company, company_indicators, page_hash)
+        logger.info(f'Getting metrics {company_indicators.company_name} ({company_indicators.ticker})')
+        return company, company_indicators
+
+    with ExitStack() as stack:
+        # The parse pool is shut down after the fetch threads which submit pages to it
+        parse_executor = None
+        if parse_workers:
+            if not CompanyFinIndicators.last_fin_year:
+                CompanyFinIndicators.calc_last_fin_year()
+            # Forked process could copy locks (logging, telemetry) held by other threads and hang on them
+            parse_executor = stack.enter_context(ProcessPoolExecutor(
+                max_workers=parse_workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_parse_worker, initargs=(CompanyFinIndicators.last_fin_year,)
+            ))
+        if executor is None:
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=workers))
+
+        def fetch(company, indicators):
+            fetch_args = (company, indicators, site_url, default_cell_val, parser, snapshots.get(company))
+            if parse_executor:
+                return submit_company_indicators(executor, parse_executor, fetch_args, history, quarterly)
+            return executor.submit(fetch_company_indicators, *fetch_args, history, quarterly)
+
+        def results(companies):
+            """Yield triples (company, FetchResult or None, error or None) in the order of companies."""
+            in_progress = deque()
+            try:
+                for company, indicators in islice(companies, window):
+                    in_progress.append((company, fetch(company, indicators)))
+                while in_progress:
+                    company, future = in_progress.popleft()
+                    try:
+                        result, error = future.result(), None
+                    except Exception as exc:
+                        result, error = None, exc
+                    for next_company, indicators in islice(companies, 1):
+                        in_progress.append((next_company, fetch(next_company, indicators)))
+                    yield company, result, error
+            finally:
+                for _, future in in_progress:
+                    future.cancel()
+
+        if completed:
+            logger.info(f'Companies taken from the checkpoint journal: {len(completed)}')
+        for company, checkpoint in completed.items():
+            if company not in companies_list:
+                continue
+            company_indicators = checkpoint.indicators
+            company_indicators.ordinary_stock = companies_list[company].get('ordinary stock', default_cell_val)
+            company_indicators.preference_stock = companies_list[company].get('preference stock', default_cell_val)
+            yield finish(company, FetchResult(company_indicators, checkpoint.page_hash, None))
+
+        failed = []
+        companies = ((company, indicators) for company, indicators in companies_list.items()
+                     if company not in completed)
+        for company, result, error in results(companies):
+            if error is None and result.page_hash:
+                yield finish(company, result)
+                continue
+            logger.warning(f'Failed to get metrics of {company}: {error or "page is not loaded"}. Retry at the end.')
+            failed.append((company, companies_list[company]))
+
+        for company, result, error in results(iter(failed)):
+            if error is not None:
+                logger.error(f'Failed to get metrics of {company}: {error}. Only stocks prices are saved.')
+                result = FetchResult(stocks_indicators(company, companies_list[company], default_cell_val), None, None)
+            yield finish(company, result)
+
+
+def fetch_companies_indicators(companies_list, site_url, default_cell_val, workers=1, parser='lxml',
+                               store=None, incremental=False, history_builder=None, parse_workers=0, executor=None,
+                               quarterly=False):
+    """Fetch financial indicators of all companies. Return dict company -> indicators in the order of companies list."""
+    return dict(iter_companies_indicators(companies_list, site_url, default_cell_val, workers, parser,
+                                          store, incremental, history_builder, parse_workers, executor,
+                                          quarterly=quarterly))
+
+
+def iter_companies_prices(companies_list, store, default_cell_val):
+    """Update stocks prices in the indicators of the last run in the store. Yield pairs (company, indicators).
+
+    Companies without indicators in the store are skipped. Indicators are saved in the store as a new run with
+    the hashes of the pages of the last run, so the next incremental run still skips unchanged pages.
+    """
+    snapshots = store.last_snapshots()
+    run_id = store.start_run()
+    skipped = 0
+    for company, stocks in companies_list.items():
+        snapshot = snapshots.get(company)
+        if snapshot is None:
+            skipped += 1
+            continue
+        company_indicators = snapshot.indicators
+        company_indicators.ordinary_stock = stocks.get('ordinary stock', default_cell_val)
+        company_indicators.preference_stock = stocks.get('preference stock', default_cell_val)
+        store.save(run_id, company_indicators, snapshot.content_hash)
+        yield company, company_indicators
+    if skipped:
+        logger.warning(f'Companies without indicators in the store are skipped: {skipped}')
+
+
+def open_sinks(params, file_name, header, default_cell_val, start_position):
+    """Return sinks of the results selected in the command line parameters."""
+    sinks = []
+    if file_name:
+        sinks.append(CsvSink(file_name, header, default_cell_val))
+    if params['jsonl_path']:
+        sinks.append(JsonLinesSink(params['jsonl_path'], header, default_cell_val))
+    if params['sqlite_path']:
+        sinks.append(SqliteSink(params['sqlite_path'], header, default_cell_val))
+    if params['gsheet'][0]:
+        sinks.append(GoogleSpreadsheetsSink(*params['gsheet'], start_position,
+                                            params['gsheet_chunk'], params['gsheet_diff']))
+    return sinks
+
+
+def save_runs_diff(store_path, runs, file_name):
+    """Save to file indicators changed between two runs from the store."""
+    store = SnapshotStore(store_path)
+    try:
+        old_run, new_run = (store.resolve_run(run_id) for run_id in runs)
+        logger.info(f'Compare runs {old_run} and {new_run}.')
+        save_changes_to_file(store.diff(old_run, new_run), file_name)
+    finally:
+        store.close()
+
+
+def serve(scrape, params, archive=None):
+    """Refresh indicators on schedule and serve them by local HTTP API until interruption.
+
+    Download threads live as long as the service, so their HTTP sessions stay open between refreshes.
+    If archive is given, pages of every refresh are saved as a new snapshot.
+    """
+    with ThreadPoolExecutor(max_workers=params['workers']) as executor:
+        def refresh():
+            if params['replay'] is None:
+                CompanyFinIndicators.calc_last_fin_year()
+            if archive:
+                HtmlFetcher.set_archive(archive, archive.start_snapshot())
+            return scrape(executor)
+
+        from daemon import IndicatorsService, QueryServer
+        service = IndicatorsService(refresh, params['refresh_interval'] * 60)
+        server = QueryServer(service, params['host'], params['serve'])
+        host, port = server.address
+        logger.info(f'Serve indicators on http://{host}:{port}/indicators')
+        service.start()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info('Service stopped.')
+        finally:
+            server.close()
+            service.stop()
 
 
 def controller():
     # Number of the first sheet the table - 0. First cell number (A1) - "1, 1".
     TableStartPosition = namedtuple('TableStartPosition', ('num_list', 'row', 'column'))
-    table_start_position = TableStartPosition(3, 3, 1),
+    table_start_position = TableStartPosition(3, 3, 1)
     default_cell_val = str()
 
     companies_ignore_list = ['IMOEX', 'RU000A0JTXM2', 'RU000A0JUQZ6', 'RU000A0JVEZ0', 'RU000A0JVT35', 'GEMA', 'RUSI']
-    companies_list_url = 'https://smart-lab.ru/q/shares/'
-    site_url = 'https://smart-lab.ru/'
 
     params = get_arg_params()
-    if not params['file_name'] and not all(params['gsheet']):
+    logger.set_format('file', params['log_format'])
+    site_url = params['site_url']
+    companies_list_url = urljoin(site_url, 'q/shares/')
+    if not (params['file_name'] or all(params['gsheet']) or params['jsonl_path'] or params['sqlite_path']
+            or params['serve'] is not None):
         logger.error('No option selected for saving results. \nSee help message: "scraper.py -h" \nExit from app.')
         raise ValueError('No option selected for saving results')
+    if params['workers'] < 1:
+        logger.error('Number of workers should be 1 or more. \nExit from app.')
+        raise ValueError('Number of workers should be 1 or more')
+    if params['parse_workers'] < 0:
+        logger.error('Number of parse processes should be 0 or more. \nExit from app.')
+        raise ValueError('Number of parse processes should be 0 or more')
+    if params['rate'] < 0:
+        logger.error('Number of requests per second should be 0 (no limit) or more. \nExit from app.')
+        raise ValueError('Number of requests per second should be 0 or more')
+    if params['retries'] < 0:
+        logger.error('Number of retries should be 0 or more. \nExit from app.')
+        raise ValueError('Number of retries should be 0 or more')
+    if params['gsheet_chunk'] < 1:
+        logger.error('Number of lines in one request to google spreadsheets should be 1 or more. \nExit from app.')
+        raise ValueError('Number of lines in one request to google spreadsheets should be 1 or more')
+    if (params['incremental'] or params['diff']) and not params['store_path']:
+        logger.error('Incremental mode and diff of runs need the store. \nSee help message: "scraper.py -h" '
+                     '\nExit from app.')
+        raise ValueError('Store is not selected')
+    if params['quarterly'] and params['prices_only']:
+        logger.error('Quarterly reports are fetched with the companies pages and do not work with prices refresh. '
+                     '\nExit from app.')
+        raise ValueError('Quarterly reports do not work with prices refresh')
+    if params['resume'] and not params['checkpoint_path']:
+        logger.error('Resume needs the checkpoint journal. \nSee help message: "scraper.py -h" \nExit from app.')
+        raise ValueError('Checkpoint journal is not selected')
+    if params['resume'] and params['history_path']:
+        logger.error('Companies from the checkpoint journal have no financial statements, so resume does not save '
+                     'history. \nSee help message: "scraper.py -h" \nExit from app.')
+        raise ValueError('History is selected for resume')
+    if params['prices_only'] and (not params['store_path'] or params['history_path']):
+        logger.error('Prices refresh needs the store and does not save history. \nSee help message: "scraper.py -h" '
+                     '\nExit from app.')
+        raise ValueError('Store is not selected or history is selected for prices refresh')
+    if params['replay'] is not None and not params['archive_path']:
+        logger.error('Replay needs the archive of pages. \nSee help message: "scraper.py -h" \nExit from app.')
+        raise ValueError('Archive is not selected')
+    if params['serve'] is not None and (params['stream'] or params['diff']):
+        logger.error('Service keeps all companies in memory and does not work in stream and diff modes. '
+                     '\nExit from app.')
+        raise ValueError('Service does not work in stream and diff modes')
+    # Indicators of the quarterly reports are added to the end of the table lines
+    quarterly_fields = CompanyQuarterlyReports.FIELDS if params['quarterly'] else ()
+    screener = None
+    if params['filters'] or params['rank']:
+        if params['stream']:
+            logger.error('Screening needs all companies and does not work in stream mode. \nExit from app.')
+            raise ValueError('Screening does not work in stream mode')
+        try:
+            # numpy is imported only for screening and the table of all companies
+            from indicators_table import IndicatorsTable
+            from screener import parse_filter, parse_rank_keys, RATIOS, Screener
+            screener = Screener([parse_filter(text) for text in params['filters']], parse_rank_keys(params['rank']))
+            screener.check_fields(set(IndicatorsTable.FIELDS) | set(RATIOS) | set(quarterly_fields))
+        except ValueError as error:
+            logger.error(f'{error} \nExit from app.')
+            raise
+    # Replacing invalid characters in a file name
+    file_name = re.sub(r'[\\/:*?"<>|+]', '', params['file_name'])
 
-    companies = Companies(companies_list_url, companies_ignore_list)
-    companies.fetch()
+    if params['diff']:
+        if not file_name:
+            logger.error('Diff of runs is saved only to file. \nSee help message: "scraper.py -h" \nExit from app.')
+            raise ValueError('File for diff of runs is not selected')
+        save_runs_diff(params['store_path'], params['diff'], file_name)
+        logger.close_logs('console')
+        logger.close_logs('file')
+        return
 
-    logger.info('Fetch data has started.')
-    companies_indicators = dict()
-    for company, indicators in companies.list.items():
-        ordinary_stock = indicators.get('ordinary stock', default_cell_val)
-        preference_stock = indicators.get('preference stock', default_cell_val)
-        company_information = CompanyFinIndicators(company, site_url, indicators['analysis_url'],
-                                                   ordinary_stock, preference_stock, default_cell_val)
-        companies_indicators[company] = company_information.fetch_fin_indicators()
-        company_name = companies_indicators[company].company_name
-        ticker = companies_indicators[company].ticker
-        logger.info(f'Getting metrics {company_name} ({ticker})')
+    archive = PageArchive(params['archive_path']) if params['archive_path'] else None
+    cache = None
+    parse_workers = params['parse_workers']
+    if params['replay'] is not None:
+        try:
+            snapshot_id, started_at = archive.resolve_snapshot(params['replay'])
+        except ValueError as error:
+            logger.error(f'{error} \nExit from app.')
+            raise
+        started_at = datetime.fromtimestamp(started_at)
+        # Reports are checked for freshness on the date of the snapshot
+        CompanyFinIndicators.calc_last_fin_year(started_at.date())
+        HtmlFetcher.set_archive(archive, snapshot_id, replay=True)
+        # Pages are read from the disk, so parsing is parallelized on all cores by default
+        parse_workers = parse_workers or os.cpu_count()
+        logger.info(f'Replay of the snapshot {snapshot_id} made {started_at:%Y-%m-%d %H:%M}.')
+    else:
+        HtmlFetcher.set_scheduler(FetchScheduler(rate=params['rate'],
+                                                 retries=params['retries'],
+                                                 max_concurrency=params['workers']))
+        if params['cache_path']:
+            # Prices on the list of companies are always revalidated
+            cache = HttpCache(params['cache_path'], ttl=params['cache_ttl'] * 60 * 60,
+                              max_size=int(params['cache_size'] * 1024 * 1024))
+            HtmlFetcher.set_cache(cache)
+        if archive and params['serve'] is None:
+            HtmlFetcher.set_archive(archive, archive.start_snapshot())
 
-    logger.info('Data has fetched.')
-    logger.info('-' * 60)
+    store = SnapshotStore(params['store_path']) if params['store_path'] else None
 
-    if params['file_name']:
-        # Replacing invalid characters in a file name
-        file_name = re.sub(r'[\\/:*?"<>|+]', '', params['file_name'])
-        save_to_file(companies_indicators, file_name, default_cell_val)
-    if params['gsheet'][0]:
+    def scrape(executor=None):
+        """Fetch companies and their indicators, save results. Return list of saved CompanyIndicators."""
+        history_builder = None
+        if params['history_path']:
+            from history import HistoryBuilder
+            history_builder = HistoryBuilder()
+        companies = Companies(companies_list_url, companies_ignore_list, params['parser'])
+        with PROFILER.stage('companies'):
+            companies.fetch()
+
+        journal = None
+        if params['checkpoint_path'] and not params['prices_only']:
+            journal = CheckpointJournal(params['checkpoint_path'], params['resume'])
+
+        try:
+            logger.info('Fetch data has started.')
+            if params['prices_only']:
+                companies_indicators = iter_companies_prices(companies.list, store, default_cell_val)
+            else:
+                companies_indicators = iter_companies_indicators(companies.list, site_url, default_cell_val,
+                                                                 params['workers'], params['parser'],
+                                                                 store, params['incremental'], history_builder,
+                                                                 parse_workers, executor, journal,
+                                                                 params['quarterly'])
+            saved_indicators = []
+            if params['stream']:
+                sinks = open_sinks(params, file_name, CompanyIndicators.HEADER + quarterly_fields, default_cell_val,
+                                   table_start_position)
+                # Results are saved by the threads of the sinks
+                with FanOut(sinks) as fan_out, PROFILER.stage('company_pages'):
+                    for _, indicators in companies_indicators:
+                        fan_out.write(indicators_lines(indicators, default_cell_val, quarterly_fields))
+            else:
+                with PROFILER.stage('company_pages'):
+                    indicators_by_company = dict(companies_indicators)
+                from indicators_table import indicators_columns, IndicatorsTable
+                companies_indicators = IndicatorsTable.from_indicators(indicators_by_company.values(), default_cell_val)
+                if quarterly_fields:
+                    companies_indicators = companies_indicators.with_columns(
+                        indicators_columns(indicators_by_company.values(), quarterly_fields)
+                    )
+                if screener:
+                    companies_indicators = screener.screen(companies_indicators)
+                    logger.info(f'Companies after screening: {len(companies_indicators)}')
+                saved_indicators = [indicators_by_company[ticker] for ticker in companies_indicators.tickers]
+
+                logger.info('Data has fetched.')
+                logger.info('-' * 60)
+
+                with PROFILER.stage('save'):
+                    sinks = open_sinks(params, file_name, companies_indicators.header, default_cell_val,
+                                       table_start_position)
+                    with FanOut(sinks) as fan_out:
+                        # Header is written if there is at least one company
+                        if len(companies_indicators):
+                            fan_out.write(companies_indicators.lines())
+
+            if history_builder:
+                history_builder.save(params['history_path'])
+                logger.info('History of financial statements saved.')
+            if journal:
+                # The run is finished, the next run starts from the beginning
+                journal.remove()
+        finally:
+            if journal:
+                journal.close()
+        if params['metrics_file']:
+            REGISTRY.save(params['metrics_file'], params['metrics_format'])
+        return saved_indicators
+
+    if params['profile_dir']:
+        PROFILER.enable()
+    if params['serve'] is not None:
+        serve(scrape, params, archive if params['replay'] is None else None)
+    else:
+        scrape()
+    if params['profile_dir']:
+        PROFILER.save(params['profile_dir'])
+        PROFILER.disable()
+        logger.info(f'Profile of the run saved to "{params["profile_dir"]}".')
+
+    logger.info('-' * 60)
+    logger.info('Metrics of the run:')
+    for line in REGISTRY.summary():
+        logger.info(line)
 
-        save_to_google_spreadsheets(companies_indicators,
-                                    *params['gsheet'],
-                                    table_start_position,
-                                    default_cell_val)
+    if store:
+        store.close()
+    if cache:
+        HtmlFetcher.set_cache(None)
+        cache.close()
+    if archive:
+        HtmlFetcher.set_archive(None)
+        archive.close()
 
     logger.close_logs('console')
     logger.close_logs('file')
 
 
 if __name__ == '__main__':
-    controller()
+    # Processes of the parse pool import this module too and must not rewrite the log
+    logger.set_logs('console')
+    logger.set_logs('file', logs_directory='.')
+    try:
+        controller()
+    finally:
+        # Records left in the queue are written when the logs are closed
+        logger.close_logs('console')
+        logger.close_logs('file')
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""Screening and ranking of companies by indicators and ratios calculated for all companies at once."""
+
+
+import operator
+import re
+
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+
+# Ratio name -> numerator, denominator and multiplier
+RATIOS = OrderedDict([
+    ('pe', ('capitalization', 'profit', 1)),
+    ('ev_ebitda', ('enterprise_value', 'ebitda', 1)),
+    ('pb', ('capitalization', 'book_value', 1)),
+    # Dividend yield in percent
+    ('dividend_yield', ('dividends_ordinary', 'ordinary_stock', 100)),
+    ('dividend_yield_pref', ('dividends_preference', 'preference_stock', 100)),
+])
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+FILTER_RE = re.compile(r'^\s*(\w+)\s*(<=|>=|==|!=|<|>)\s*(-?\d+(?:\.\d+)?)\s*$')
+
+# Condition of the filter: indicator or ratio name, comparison operator and value
+Filter = namedtuple('Filter', ('field', 'operator', 'value'))
+# Key of the ranking: indicator or ratio name and direction
+RankKey = namedtuple('RankKey', ('field', 'descending'))
+
+
+def calc_ratios(table):
+    """Return dict ratio name -> masked array of the ratio of all companies.
+
+    The ratio is missing if one of the indicators is missing or the denominator is zero.
+    """
+    ratios = OrderedDict()
+    for name, (numerator, denominator, multiplier) in RATIOS.items():
+        ratios[name] = np.ma.round(np.ma.divide(table.column(numerator), table.column(denominator)) * multiplier, 2)
+    return ratios
+
+
+def parse_filter(text):
+    """Parse filter like "pe < 15"."""
+    match = FILTER_RE.match(text)
+    if not match:
+        raise ValueError(f'Wrong filter "{text}". Example of filter: "pe < 15"')
+    field, sign, value = match.groups()
+    return Filter(field, OPERATORS[sign], float(value))
+
+
+def parse_rank_keys(text):
+    """Parse ranking keys like "pe,-roe": ascending P/E, then descending ROE."""
+    keys = []
+    for key in text.split(','):
+        key = key.strip()
+        if key:
+            keys.append(RankKey(key.lstrip('-'), key.startswith('-')))
+    return keys
+
+
+class Screener:
+    """Adds ratios to the table, selects companies matching all filters and sorts them by ranking keys.
+
+    Companies with missing value of the filtered indicator do not match the filter. Companies with missing value
+    of the ranking key are placed after the companies with this value.
+    """
+
+    def __init__(self, filters=(), rank_keys=()):
+        self._filters = filters
+        self._rank_keys = rank_keys
+
+    def screen(self, table):
+        """Return new IndicatorsTable with ratios columns, screened and ranked."""
+        table = table.with_columns(calc_ratios(table))
+        self.__check_fields(table)
+
+        selected = np.ones(len(table), dtype=bool)
+        for field, compare, value in self._filters:
+            column = table.column(field)
+            selected &= compare(column.filled(np.nan), value) & ~np.ma.getmaskarray(column)
+        table = table.take(np.flatnonzero(selected))
+
+        if self._rank_keys:
+            sort_keys = []
+            for field, descending in self._rank_keys:
+                column = table.column(field)
+                sort_keys.append((-column if descending else column).filled(np.inf))
+            # np.lexsort sorts by the last key first
+            table = table.take(np.lexsort(sort_keys[::-1]))
+        return table
+
+    def check_fields(self, fields):
+        """Raise ValueError if a filter or a ranking key uses the field not from fields."""
+        for field in [key.field for key in self._filters] + [key.field for key in self._rank_keys]:
+            if field not in fields:
+                raise ValueError(f'Unknown indicator "{field}"')
+
+    def __check_fields(self, table):
+        self.check_fields(set(table.FIELDS) | set(table.extra_columns))
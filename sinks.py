@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""Outputs of the results: sinks of table lines and fan-out writing lines to several sinks at once."""
+
+
+import json
+import threading
+import time
+
+from queue import Queue
+
+from profiling import PROFILER
+from telemetry import UPLOAD_SECONDS
+from uploaders import CsvFile, open_google_spreadsheets
+from utils import Logger
+
+
+logger = Logger('scraper')
+
+# Item of the queue telling the thread of the sink to abort it
+ABORT = object()
+
+
+class CsvSink:
+    """Writes lines to csv file. Lines are flushed after every write, so the file grows as companies are fetched."""
+    name = 'csv'
+
+    def __init__(self, path, header, default_cell_val=''):
+        self._file = CsvFile(path, default_cell_val, header)
+
+    def write(self, lines):
+        self._file.write_lines(lines)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def abort(self):
+        """Close the file. Lines written before are left in it."""
+        self._file.close()
+
+
+class JsonLinesSink:
+    """Writes every line as JSON object with header names as keys. Values equal to default are null.
+
+    Lines are written through the buffer of buffer_size bytes.
+    """
+    name = 'json_lines'
+
+    def __init__(self, path, header, default_cell_val='', buffer_size=1024 * 1024):
+        self._file = open(path, 'w', encoding='utf-8', buffering=buffer_size)
+        self._header = header
+        self._default_cell_val = default_cell_val
+
+    def write(self, lines):
+        self._file.write(''.join(
+            json.dumps({name: None if value == self._default_cell_val else value
+                        for name, value in zip(self._header, line)}, ensure_ascii=False) + '\n'
+            for line in lines
+        ))
+
+    def close(self):
+        self._file.close()
+
+    def abort(self):
+        """Close the file. Lines written before are left in it."""
+        self._file.close()
+
+
+class SqliteSink:
+    """Replaces the table of SQLite database with the lines. Values equal to default are NULL.
+
+    Lines are inserted by batches of batch_size lines in one transaction, so readers see either the previous or
+    the new table.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path, header, default_cell_val='', table='indicators', batch_size=500):
+        self._default_cell_val = default_cell_val
+        self._batch_size = batch_size
+        self._batch = []
+        import sqlite3
+        # Lines are written by the thread of the fan-out
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        columns = ', '.join(self.__quote(name) for name in header)
+        self._insert = f'INSERT INTO {self.__quote(table)} VALUES ({", ".join("?" * len(header))})'
+        self._connection.execute('BEGIN')
+        self._connection.execute(f'DROP TABLE IF EXISTS {self.__quote(table)}')
+        self._connection.execute(f'CREATE TABLE {self.__quote(table)} ({columns})')
+
+    def write(self, lines):
+        self._batch.extend([None if value == self._default_cell_val else value for value in line] for line in lines)
+        if len(self._batch) >= self._batch_size:
+            self.__insert_batch()
+
+    def close(self):
+        try:
+            self.__insert_batch()
+            self._connection.execute('COMMIT')
+        finally:
+            if self._connection.in_transaction:
+                self._connection.execute('ROLLBACK')
+            self._connection.close()
+
+    def abort(self):
+        """Roll back the transaction, so the previous table is kept, and close the connection."""
+        try:
+            if self._connection.in_transaction:
+                self._connection.execute('ROLLBACK')
+        finally:
+            self._connection.close()
+
+    def __insert_batch(self):
+        self._connection.executemany(self._insert, self._batch)
+        self._batch = []
+
+    @staticmethod
+    def __quote(name):
+        return '"' + name.replace('"', '""') + '"'
+
+
+class GoogleSpreadsheetsSink:
+    """Collects lines and uploads them to google table when closed.
+
+    The table is opened on the first write, so authorization runs in the thread of the fan-out too.
+    """
+    name = 'google_spreadsheets'
+
+    def __init__(self, table_url, google_key_file, start_position, chunk_size=500, diff=False):
+        self._table_params = (table_url, start_position, google_key_file, chunk_size, diff)
+        self._table = None
+
+    def write(self, lines):
+        table = self.__open_table()
+        for line in lines:
+            table.add_line_cells(line)
+
+    def close(self):
+        self.__open_table().upload()
+
+    def abort(self):
+        """Discard the collected lines without upload."""
+        self._table = None
+
+    def __open_table(self):
+        if self._table is None:
+            self._table = open_google_spreadsheets(*self._table_params)
+        return self._table
+
+
+class FanOut:
+    """Writes lines to all sinks concurrently.
+
+    Every sink has its own thread and queue, so a slow sink does not hold up the others and the total time is the
+    time of the slowest sink. Error of one sink does not stop the others, the first error is raised on close.
+    Failed sink is aborted instead of closing, so its incomplete results are not committed. If the error is raised
+    while lines are produced, all sinks are aborted.
+    """
+
+    def __init__(self, sinks, queue_size=1000):
+        self._errors = []
+        self._workers = []
+        for sink in sinks:
+            queue = Queue(maxsize=queue_size)
+            thread = threading.Thread(target=self.__run, args=(sink, queue), name=f'sink-{sink.name}', daemon=True)
+            thread.start()
+            self._workers.append((queue, thread))
+
+    def write(self, lines):
+        """Send lines to all sinks."""
+        lines = list(lines)
+        for queue, _ in self._workers:
+            queue.put(lines)
+
+    def close(self):
+        """Wait until all sinks have written the lines and are closed."""
+        for queue, _ in self._workers:
+            queue.put(None)
+        for _, thread in self._workers:
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def abort(self):
+        """Abort all sinks without closing them."""
+        for queue, _ in self._workers:
+            queue.put(ABORT)
+        for _, thread in self._workers:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def __run(self, sink, queue):
+        with PROFILER.stage('save'):
+            self.__save(sink, queue)
+
+    def __save(self, sink, queue):
+        busy_seconds = 0.0
+        failed = False
+        while True:
+            lines = queue.get()
+            if lines is None:
+                break
+            if lines is ABORT:
+                self.__abort(sink)
+                return
+            if failed:
+                # Lines are taken from the queue, so writing to other sinks does not stop
+                continue
+            start = time.perf_counter()
+            try:
+                sink.write(lines)
+            except Exception as error:
+                failed = self.__fail(sink, error)
+            busy_seconds += time.perf_counter() - start
+        if failed:
+            self.__abort(sink)
+            return
+        start = time.perf_counter()
+        try:
+            sink.close()
+        except Exception as error:
+            self.__fail(sink, error)
+            return
+        UPLOAD_SECONDS.observe(busy_seconds + time.perf_counter() - start, uploader=sink.name)
+        logger.info(f'Save to {sink.name} complete.')
+
+    @staticmethod
+    def __abort(sink):
+        try:
+            sink.abort()
+        except Exception as error:
+            logger.error(f'Failed to abort saving results to {sink.name}: {error}')
+        else:
+            logger.info(f'Save to {sink.name} aborted.')
+
+    def __fail(self, sink, error):
+        logger.error(f'Failed to save results to {sink.name}: {error}')
+        self._errors.append(error)
+        return True
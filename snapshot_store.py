@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""Local store of companies financial indicators snapshots."""
+
+
+import json
+import sys
+import threading
+
+from collections import namedtuple
+from datetime import datetime
+from hashlib import sha1
+
+from metrics_collectors import CompanyIndicators
+
+
+# Indicators of the company saved in some run and hash of the page they were found on
+Snapshot = namedtuple('Snapshot', ('run_id', 'content_hash', 'indicators'))
+# Changed indicator of the company between two runs
+Change = namedtuple('Change', ('ticker', 'field', 'old', 'new'))
+
+
+def content_hash(page):
+    """Return hash of the page content. None if the page is not loaded."""
+    if page is None:
+        return None
+    return sha1(page.encode('utf-8')).hexdigest()
+
+
+class SnapshotStore:
+    """Stores CompanyIndicators of every run in SQLite database by ticker and run."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        import sqlite3
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT, started_at TEXT)'
+            )
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS snapshots ('
+                'run_id INTEGER, ticker TEXT, content_hash TEXT, indicators TEXT, PRIMARY KEY (run_id, ticker))'
+            )
+
+    def start_run(self):
+        """Register new run and return its id."""
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                'INSERT INTO runs (started_at) VALUES (?)', (datetime.now().isoformat(timespec='seconds'),)
+            )
+        return cursor.lastrowid
+
+    def runs(self):
+        """Return list of runs ids from oldest to newest."""
+        with self._lock:
+            return [row[0] for row in self._connection.execute('SELECT run_id FROM runs ORDER BY run_id')]
+
+    def resolve_run(self, run_id):
+        """Return run id. Negative numbers count runs from the end: -1 is the last run."""
+        if run_id >= 0:
+            return run_id
+        try:
+            return self.runs()[run_id]
+        except IndexError:
+            raise ValueError(f'Run {run_id} not found in store')
+
+    def save(self, run_id, indicators, page_hash=None):
+        """Save indicators of the company in the run."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)',
+                (run_id, indicators.ticker, page_hash, json.dumps(indicators.to_dict(), ensure_ascii=False))
+            )
+
+    def last_snapshots(self, before_run=None):
+        """Return dict ticker -> the latest snapshot of the company made before the run."""
+        query = (
+            'SELECT s.ticker, s.run_id, s.content_hash, s.indicators FROM snapshots s '
+            'JOIN (SELECT ticker, MAX(run_id) AS run_id FROM snapshots WHERE run_id < ? GROUP BY ticker) last '
+            'ON s.ticker = last.ticker AND s.run_id = last.run_id'
+        )
+        if before_run is None:
+            before_run = sys.maxsize
+        with self._lock:
+            rows = self._connection.execute(query, (before_run,)).fetchall()
+        return {ticker: Snapshot(run_id, page_hash, self.__load(data)) for ticker, run_id, page_hash, data in rows}
+
+    def load_run(self, run_id):
+        """Return dict ticker -> indicators saved in the run."""
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT ticker, indicators FROM snapshots WHERE run_id = ? ORDER BY rowid', (run_id,)
+            ).fetchall()
+        return {ticker: self.__load(data) for ticker, data in rows}
+
+    def diff(self, old_run_id, new_run_id):
+        """Return list of indicators changed between two runs.
+
+        Companies present only in one of the runs are compared with empty indicators.
+        """
+        old_run = self.load_run(old_run_id)
+        new_run = self.load_run(new_run_id)
+        changes = []
+        for ticker in list(old_run) + [ticker for ticker in new_run if ticker not in old_run]:
+            old = old_run.get(ticker) or self.__empty_indicators(new_run[ticker])
+            new = new_run.get(ticker) or self.__empty_indicators(old)
+            old, new = old.to_dict(), new.to_dict()
+            for field in old:
+                if field in ('default_val', 'ticker'):
+                    continue
+                if old[field] != new[field]:
+                    changes.append(Change(ticker, field, old[field], new[field]))
+        return changes
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def __empty_indicators(indicators):
+        return CompanyIndicators(default_val=indicators.default_val, ticker=indicators.ticker)
+
+    @staticmethod
+    def __load(data):
+        return CompanyIndicators(**json.loads(data))
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+"""Counters and latency histograms of the scraper stages with export to JSON and Prometheus text format."""
+
+
+import json
+import math
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+
+class Counter:
+    """Monotonically increasing value for every set of labels."""
+    type = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        """Return list of pairs (labels, value)."""
+        with self._lock:
+            return [(dict(key), value) for key, value in sorted(self._values.items())]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """Distribution of observed values (seconds) by buckets for every set of labels."""
+    type = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0, 'max': 0.0}
+            for num_bucket, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][num_bucket] += 1
+                    break
+            series['count'] += 1
+            series['sum'] += value
+            series['max'] = max(series['max'], value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe duration of the block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        """Return list of pairs (labels, dict with buckets counts, count, sum and max)."""
+        with self._lock:
+            return [(dict(key), dict(series, buckets=list(series['buckets'])))
+                    for key, series in sorted(self._values.items())]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Registry:
+    """Set of metrics of the run."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, description):
+        metric = Counter(name, description)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, description, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def reset(self):
+        for metric in self._metrics:
+            metric.reset()
+
+    def summary(self):
+        """Return list of text lines: one line for every metric and set of labels."""
+        lines = []
+        for metric in self._metrics:
+            for labels, value in metric.samples():
+                name = metric.name + self.__labels_text(labels)
+                if metric.type == 'counter':
+                    lines.append(f'{name}: {value:g}')
+                else:
+                    mean = value['sum'] / value['count']
+                    lines.append(f'{name}: count {value["count"]}, total {value["sum"]:.3f} s, '
+                                 f'mean {mean * 1000:.1f} ms, max {value["max"] * 1000:.1f} ms')
+        return lines
+
+    def to_json(self):
+        return json.dumps({
+            metric.name: {
+                'type': metric.type,
+                'description': metric.description,
+                'samples': [{'labels': labels, 'value': value} for labels, value in metric.samples()],
+            }
+            for metric in self._metrics
+        }, indent=2)
+
+    def to_prometheus(self):
+        """Return metrics in Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for labels, value in metric.samples():
+                if metric.type == 'counter':
+                    lines.append(f'{metric.name}{self.__labels_text(labels)} {value:g}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value['buckets']):
+                    cumulative += count
+                    bucket_labels = dict(labels, le='+Inf' if bound == math.inf else f'{bound:g}')
+                    lines.append(f'{metric.name}_bucket{self.__labels_text(bucket_labels)} {cumulative}')
+                lines.append(f'{metric.name}_sum{self.__labels_text(labels)} {value["sum"]:g}')
+                lines.append(f'{metric.name}_count{self.__labels_text(labels)} {value["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path, file_format='json'):
+        """Save metrics to file in "json" or "prometheus" format."""
+        text = self.to_prometheus() if file_format == 'prometheus' else self.to_json()
+        with open(path, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(text)
+
+    @staticmethod
+    def __labels_text(labels):
+        if not labels:
+            return ''
+        values = ','.join(f'{name}="{value}"' for name, value in labels.items())
+        return '{' + values + '}'
+
+
+REGISTRY = Registry()
+
+FETCH_SECONDS = REGISTRY.histogram('scraper_fetch_seconds', 'Time of page download including retries')
+HTTP_RESPONSES = REGISTRY.counter('scraper_http_responses_total', 'HTTP responses by status code')
+DOWNLOADED_BYTES = REGISTRY.counter('scraper_downloaded_bytes_total',
+                                    'Bytes of downloaded pages as received (compressed)')
+FETCH_ERRORS = REGISTRY.counter('scraper_fetch_errors_total', 'Pages not downloaded by error type')
+CACHE_REQUESTS = REGISTRY.counter('scraper_cache_requests_total', 'Cache lookups by result')
+RETRIES = REGISTRY.counter('scraper_retries_total', 'Repeated requests by reason')
+PARSE_SECONDS = REGISTRY.histogram('scraper_parse_seconds', 'Time of page parsing by page type')
+UPLOAD_SECONDS = REGISTRY.histogram('scraper_upload_seconds', 'Time of results saving by uploader')
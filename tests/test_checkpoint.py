@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from checkpoint import CheckpointJournal
+from metrics_collectors import CompanyIndicators
+
+
+def test_checkpoint_journal_resume(tmp_path):
+    path = str(tmp_path / 'scraper.checkpoint')
+    journal = CheckpointJournal(path)
+    journal.record('SBER', CompanyIndicators(ticker='SBER', profit=870.1), 'hash')
+    journal.record('GAZP', CompanyIndicators(ticker='GAZP'), 'gazp')
+    journal.close()
+    # Line broken by the crash
+    with open(path, 'a', encoding='utf-8') as journal_file:
+        journal_file.write('{"company": "LK')
+
+    journal = CheckpointJournal(path, resume=True)
+    completed = journal.completed()
+    assert list(completed) == ['SBER', 'GAZP']
+    assert completed['SBER'].indicators.profit == 870.1
+    assert completed['SBER'].page_hash == 'hash'
+    journal.record('LKOH', CompanyIndicators(ticker='LKOH'), 'lkoh')
+    journal.close()
+    assert list(CheckpointJournal(path, resume=True).completed()) == ['SBER', 'GAZP', 'LKOH']
+    assert CheckpointJournal(path).completed() == {}
+
+
+def test_checkpoint_journal_keeps_companies_if_rewrite_fails(tmp_path, mocker):
+    path = str(tmp_path / 'scraper.checkpoint')
+    journal = CheckpointJournal(path)
+    journal.record('SBER', CompanyIndicators(ticker='SBER', profit=870.1), 'hash')
+    journal.close()
+
+    mocker.patch('checkpoint.os.replace', side_effect=OSError)
+    with pytest.raises(OSError):
+        CheckpointJournal(path, resume=True)
+    mocker.stopall()
+    assert list(CheckpointJournal(path, resume=True).completed()) == ['SBER']
+    assert not os.path.exists(path + '.tmp')
@@ -0,0 +1,49 @@
+import json
+import threading
+
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from daemon import IndicatorsService, QueryServer
+from metrics_collectors import CompanyIndicators
+
+
+@pytest.fixture
+def server():
+    service = IndicatorsService(lambda: [CompanyIndicators(ticker='SBER', company_name='Сбербанк', profit=870.1),
+                                         CompanyIndicators(ticker='GAZP', profit=1.5)], interval=60)
+    service.refresh()
+    server = QueryServer(service, port=0)
+    service.start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.close()
+    service.stop()
+
+
+def get(server, path):
+    host, port = server.address
+    with urlopen(f'http://{host}:{port}{path}') as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def test_query_server(server):
+    assert [company['ticker'] for company in get(server, '/indicators')] == ['SBER', 'GAZP']
+    assert get(server, '/indicators/sber')['company_name'] == 'Сбербанк'
+    assert get(server, '/status')['companies'] == 2
+    with pytest.raises(HTTPError) as error:
+        get(server, '/indicators/LKOH')
+    assert error.value.code == 404
+
+
+def test_indicators_service_keeps_indicators_after_failed_refresh():
+    results = iter([[CompanyIndicators(ticker='SBER')]])
+    service = IndicatorsService(lambda: next(results), interval=60)
+    service.refresh()
+    with pytest.raises(StopIteration):
+        service.refresh()
+    assert json.loads(service.company('SBER'))['ticker'] == 'SBER'
+    assert json.loads(service.status())['refreshing'] is False
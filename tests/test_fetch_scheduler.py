@@ -0,0 +1,55 @@
+import pytest
+import requests
+
+from fetch_scheduler import AdaptiveLimiter, FetchScheduler
+
+
+@pytest.fixture
+def sleep(mocker):
+    return mocker.patch('fetch_scheduler.time.sleep')
+
+
+def test_fetch_scheduler_retries_with_retry_after(mocker, sleep):
+    throttled = mocker.Mock(status_code=429, headers={'Retry-After': '7'})
+    ok = mocker.Mock(status_code=200, headers={})
+    send = mocker.Mock(side_effect=[throttled, ok])
+    assert FetchScheduler(retries=3).request(send, 'https://smart-lab.ru/q/shares/') is ok
+    sleep.assert_called_once_with(7.0)
+
+
+@pytest.mark.parametrize('retries', [0, 2])
+def test_fetch_scheduler_returns_last_response(mocker, sleep, retries):
+    failed = mocker.Mock(status_code=500, headers={})
+    send = mocker.Mock(return_value=failed)
+    assert FetchScheduler(retries=retries).request(send, 'url') is failed
+    assert send.call_count == retries + 1
+    assert sleep.call_count == retries
+
+
+def test_fetch_scheduler_raises_after_timeouts(mocker, sleep):
+    send = mocker.Mock(side_effect=requests.exceptions.Timeout)
+    with pytest.raises(requests.exceptions.Timeout):
+        FetchScheduler(retries=2).request(send, 'url')
+    assert send.call_count == 3
+
+
+def test_fetch_scheduler_releases_slot_after_other_errors(mocker, sleep):
+    scheduler = FetchScheduler(retries=3, max_concurrency=1)
+    send = mocker.Mock(side_effect=requests.exceptions.ChunkedEncodingError)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        scheduler.request(send, 'url')
+    assert send.call_count == 1
+    ok = mocker.Mock(status_code=200, headers={})
+    # The second request does not wait for the slot of the failed one
+    assert scheduler.request(mocker.Mock(return_value=ok), 'url') is ok
+
+
+def test_adaptive_limiter():
+    limiter = AdaptiveLimiter(8)
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 4
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 5
@@ -0,0 +1,22 @@
+import math
+
+from history import History, HistoryBuilder
+from metrics_collectors import CompanyHistory
+
+
+def test_history_save_and_load(tmp_path):
+    builder = HistoryBuilder()
+    builder.add('SBER', CompanyHistory([2018, 2019], {'net_income': [832.9, 845.0], 'ev': [math.nan, 100.0]}))
+    builder.add('GAZP', CompanyHistory([2019, 2020], {'net_income': [1202.0, 135.0]}))
+    path = str(tmp_path / 'history')
+    builder.save(path)
+
+    history = History(path)
+    assert history.tickers == ['SBER', 'GAZP']
+    assert history.fields == ['ev', 'net_income']
+    assert history.years == [2018, 2019, 2020]
+    assert history.value('SBER', 'net_income', 2019) == 845.0
+    assert math.isnan(history.value('SBER', 'net_income', 2020))
+    assert math.isnan(history.value('GAZP', 'ev', 2019))
+    assert history.company('GAZP').shape == (2, 3)
+    assert history.field('net_income')[1, 1:].tolist() == [1202.0, 135.0]
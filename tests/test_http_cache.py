@@ -0,0 +1,36 @@
+import pytest
+
+from http_cache import HttpCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = HttpCache(str(tmp_path / 'cache.sqlite'), ttl=60, max_size=1024 * 1024)
+    yield cache
+    cache.close()
+
+
+def test_http_cache_put_and_get(cache):
+    assert cache.get('url') is None
+    cache.put('url', '<html>страница</html>', etag='"abc"', last_modified='Wed, 21 Oct 2015 07:28:00 GMT')
+    page = cache.get('url')
+    assert page.text == '<html>страница</html>'
+    assert page.etag == '"abc"'
+    assert page.last_modified == 'Wed, 21 Oct 2015 07:28:00 GMT'
+    assert cache.is_fresh(page)
+
+
+def test_http_cache_evicts_least_recently_used(tmp_path, mocker):
+    time = mocker.patch('http_cache.time.time', return_value=1.0)
+    cache = HttpCache(str(tmp_path / 'cache.sqlite'), max_size=50)
+    for num, url in enumerate(['first', 'second', 'third'], start=1):
+        time.return_value = float(num)
+        cache.put(url, url * 2)
+    time.return_value = 4.0
+    cache.get('first')
+    time.return_value = 5.0
+    cache.put('fourth', 'fourth' * 2)
+    assert cache.get('second') is None
+    assert cache.get('first') is not None
+    assert cache.get('fourth') is not None
+    cache.close()
@@ -0,0 +1,49 @@
+import numpy as np
+
+from indicators_table import indicators_columns, IndicatorsTable
+from metrics_collectors import CompanyIndicators
+
+
+def make_table():
+    return IndicatorsTable.from_indicators([
+        CompanyIndicators(ticker='SBER', company_name='Сбербанк', ordinary_stock=250.1, preference_stock=220.5,
+                          profit=870.1, dividends_ordinary=18.7, dividends_preference=18.8),
+        CompanyIndicators(ticker='GAZP', company_name='Газпром', ordinary_stock=150.0),
+        CompanyIndicators(ticker='ABCD', company_name='Без акций', profit=1.0),
+    ])
+
+
+def test_indicators_table_column():
+    profit = make_table().column('profit')
+    assert profit.tolist() == [870.1, None, 1.0]
+    assert profit.sum() == 871.1
+
+
+def test_indicators_table_lines():
+    lines = list(make_table().lines())
+    assert lines == [
+        list(CompanyIndicators(ticker='SBER', company_name='Сбербанк', ordinary_stock=250.1, profit=870.1,
+                               dividends_ordinary=18.7).indicators_ordinary.values()),
+        list(CompanyIndicators(ticker='SBER', company_name='Сбербанк', preference_stock=220.5, profit=870.1,
+                               dividends_preference=18.8).indicators_preference.values()),
+        list(CompanyIndicators(ticker='GAZP', company_name='Газпром',
+                               ordinary_stock=150.0).indicators_ordinary.values()),
+    ]
+
+
+def test_indicators_table_record():
+    table = make_table()
+    record = table.record(0)
+    assert record.to_dict() == CompanyIndicators(ticker='SBER', company_name='Сбербанк', ordinary_stock=250.1,
+                                                 preference_stock=220.5, profit=870.1, dividends_ordinary=18.7,
+                                                 dividends_preference=18.8).to_dict()
+    assert np.count_nonzero(~table.mask) == 7
+
+
+def test_indicators_columns():
+    indicators = [CompanyIndicators(ticker='SBER', ordinary_stock=250.1, quarter_profit=194.3),
+                  CompanyIndicators(ticker='GAZP', ordinary_stock=150.0)]
+    table = IndicatorsTable.from_indicators(indicators)
+    table = table.with_columns(indicators_columns(indicators, ('quarter_profit',)))
+    assert table.header == CompanyIndicators.HEADER + ('quarter_profit',)
+    assert [line[-1] for line in table.lines()] == [194.3, '']
@@ -0,0 +1,156 @@
+import math
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from http_cache import HttpCache
+from metrics_collectors import (Companies, CompanyFinIndicators, CompanyQuarterlyReports, init_parse_worker,
+                                parse_company_page)
+from page_parsers import FIN_TABLE_CLASS, PARSERS, SHARES_TABLE_CLASS, TableEndDetector
+from utils import HtmlFetcher
+
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'pages')
+
+
+def read_page(name):
+    with open(os.path.join(PAGES_DIR, name), encoding='utf-8') as page:
+        return page.read()
+
+
+@pytest.fixture
+def company_page(mocker):
+    mocker.patch.object(CompanyFinIndicators, 'last_fin_year', 2019)
+    mocker.patch('metrics_collectors.HtmlFetcher.fetch_page', return_value=read_page('company.html'))
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_companies_fetch(mocker, parser):
+    mocker.patch('metrics_collectors.HtmlFetcher.fetch_page', return_value=read_page('shares.html'))
+    companies = Companies('https://smart-lab.ru/q/shares/', ['IMOEX'], parser)
+    companies.fetch()
+    assert companies.list == {
+        'SBER': {'ordinary stock': 250.1, 'preference stock': 220.5, 'analysis_url': '/q/SBER/f/y/'},
+        'GAZP': {'ordinary stock': '', 'analysis_url': '/q/GAZP/f/y/'},
+    }
+
+
+def test_companies_fetch_revalidates_cached_list(mocker, tmp_path):
+    page = read_page('shares.html')
+    response = mocker.Mock(status_code=200, encoding='utf-8', headers={'ETag': '"prices"'},
+                           raw=mocker.Mock(**{'tell.return_value': 0}))
+    response.iter_content.side_effect = lambda *args, **kwargs: iter([page])
+    session = mocker.Mock()
+    session.get.return_value = response
+    cache = HttpCache(str(tmp_path / 'cache.sqlite'), ttl=60 * 60)
+    mocker.patch.object(HtmlFetcher, '_session', session)
+    mocker.patch.object(HtmlFetcher, '_scheduler', None)
+    mocker.patch.object(HtmlFetcher, '_cache', cache)
+
+    # The second run is inside ttl of the cached list
+    for _ in range(2):
+        companies = Companies('https://smart-lab.ru/q/shares/', ['IMOEX'])
+        companies.fetch()
+    cache.close()
+    assert session.get.call_count == 2
+    assert session.get.call_args.kwargs['headers']['If-None-Match'] == '"prices"'
+    assert companies.list['SBER']['ordinary stock'] == 250.1
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_fetch_fin_indicators(company_page, parser):
+    company = CompanyFinIndicators('SBER', 'https://smart-lab.ru/', '/q/SBER/f/y/', 250.1, 220.5, parser=parser)
+    indicators = company.fetch_fin_indicators()
+    assert indicators.company_name == 'Сбербанк'
+    assert indicators.profit == 870.1
+    assert indicators.average_profit == 638.28
+    assert indicators.proceeds == 2750.0
+    assert indicators.capitalization == 5012.0
+    assert indicators.enterprise_value == ''
+    assert indicators.roe == 20.1
+    assert indicators.dividends_ordinary == 18.7
+    assert indicators.dividends_preference == 18.7
+    assert indicators.book_value == 4200.0
+    assert indicators.ebitda == ''
+
+
+def test_fetch_fin_indicators_old_report(company_page, mocker):
+    mocker.patch.object(CompanyFinIndicators, 'last_fin_year', 2020)
+    indicators = CompanyFinIndicators('SBER', 'https://smart-lab.ru/', '/q/SBER/f/y/', 250.1).fetch_fin_indicators()
+    assert indicators.profit == 870.1
+    assert indicators.average_profit == ''
+    assert indicators.dividends_ordinary == ''
+
+
+@pytest.mark.parametrize('page, parse', [
+    ('company.html', 'parse_fin_table'),
+    ('shares.html', 'parse_shares_table'),
+])
+def test_parsers_return_same_values(page, parse):
+    html = read_page(page)
+    assert getattr(PARSERS['lxml'], parse)(html) == getattr(PARSERS['soup'], parse)(html)
+
+
+@pytest.mark.parametrize('parser', ['lxml', 'soup'])
+def test_company_quarterly_reports(mocker, parser):
+    fetch_page = mocker.patch('metrics_collectors.HtmlFetcher.fetch_page',
+                              return_value=read_page('company_quarterly.html'))
+    reports = CompanyQuarterlyReports('https://smart-lab.ru/', '/q/SBER/f/y/', parser=parser)
+    quarters = reports.parse_page(reports.fetch_page())
+    assert fetch_page.call_args.args[0] == 'https://smart-lab.ru/q/SBER/f/q/'
+    assert quarters == {
+        'quarter_profit': 194.3,
+        'profit_4q': 845.0,
+        'quarter_proceeds': 705.0,
+        # Proceeds of one of the last four quarters is missing
+        'proceeds_4q': '',
+    }
+
+
+def test_company_quarterly_reports_without_page():
+    reports = CompanyQuarterlyReports('https://smart-lab.ru/', '/forum/SBER', default_val='-')
+    assert reports.fetch_page() is None
+    assert set(reports.parse_page(None).values()) == {'-'}
+
+
+@pytest.mark.parametrize('page, table_class', [
+    ('company.html', FIN_TABLE_CLASS),
+    ('shares.html', SHARES_TABLE_CLASS),
+])
+def test_table_end_detector(page, table_class):
+    html = read_page(page)
+    table_end = TableEndDetector(table_class)
+    # Parts cut the tags of the tables
+    parts = [html[start:start + 7] for start in range(0, len(html), 7)]
+    closed_at = next(index for index, part in enumerate(parts) if table_end.feed(part))
+    table_end_at = html.index('</table>', html.index(table_class)) + len('</table>')
+    assert closed_at == (table_end_at - 1) // 7
+
+
+def test_table_end_detector_counts_nested_tables():
+    table_end = TableEndDetector('data')
+    assert not table_end.feed('<table class="menu"></table><TABLE class=\'data\'><tr><td><table>')
+    assert not table_end.feed('</table></td></tr>')
+    assert table_end.feed('</table><table class="data"></table>')
+
+
+def test_company_history(company_page):
+    company = CompanyFinIndicators('SBER', 'https://smart-lab.ru/', '/q/SBER/f/y/', 250.1)
+    company.fetch_fin_indicators()
+    history = company.history()
+    assert history.years == [2015, 2016, 2017, 2018, 2019]
+    assert history.fields['revenue'] == [1697.0, 2151.0, 2359.0, 2568.0, 2712.0]
+    assert history.fields['net_income'][0] == 222.9
+    assert all(math.isnan(value) for value in history.fields['ev'])
+
+
+def test_parse_company_page_in_process_pool(company_page):
+    company = CompanyFinIndicators('SBER', 'https://smart-lab.ru/', '/q/SBER/f/y/', 250.1, 220.5)
+    page = read_page('company.html')
+    with ProcessPoolExecutor(max_workers=1, initializer=init_parse_worker, initargs=(2019,)) as executor:
+        indicators, history, parse_seconds = executor.submit(parse_company_page, company, page, True).result()
+    assert indicators.to_dict() == company.parse_page(page).to_dict()
+    assert history.years == company.history().years
+    assert parse_seconds > 0
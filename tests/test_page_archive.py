@@ -0,0 +1,51 @@
+import pytest
+
+from page_archive import PageArchive
+from utils import HtmlFetcher
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = PageArchive(str(tmp_path / 'archive.sqlite'))
+    yield archive
+    archive.close()
+
+
+def test_page_archive_snapshots(archive):
+    first = archive.start_snapshot()
+    archive.put(first, 'url', '<html>старая</html>')
+    archive.put(first, 'other', '<html>другая</html>')
+    second = archive.start_snapshot()
+    archive.put(second, 'url', '<html>новая</html>')
+    archive.put(second, 'other', '<html>другая</html>')
+
+    assert archive.get('url', first).text == '<html>старая</html>'
+    assert archive.get('url').text == '<html>новая</html>'
+    assert archive.get('missing', first) is None
+    assert archive.urls(second) == ['other', 'url']
+    assert archive.resolve_snapshot(-2)[0] == first
+    with pytest.raises(ValueError):
+        archive.resolve_snapshot(10)
+    # Unchanged page is stored once
+    assert archive._connection.execute('SELECT COUNT(*) FROM bodies').fetchone()[0] == 3
+
+
+def test_html_fetcher_records_and_replays_pages(archive, mocker):
+    session = mocker.Mock()
+    session.get.return_value = mocker.Mock(status_code=200, text='<html>page</html>', headers={},
+                                           raw=mocker.Mock(**{'tell.return_value': 17}))
+    mocker.patch.object(HtmlFetcher, '_session', session)
+    mocker.patch.object(HtmlFetcher, '_scheduler', None)
+    mocker.patch.object(HtmlFetcher, '_cache', None)
+    snapshot = archive.start_snapshot()
+
+    HtmlFetcher.set_archive(archive, snapshot)
+    try:
+        assert HtmlFetcher().fetch_page('url') == '<html>page</html>'
+        HtmlFetcher.set_archive(archive, snapshot, replay=True)
+        assert HtmlFetcher().fetch_page('url') == '<html>page</html>'
+        with pytest.raises(ConnectionError):
+            HtmlFetcher().fetch_page('missing')
+    finally:
+        HtmlFetcher.set_archive(None)
+    assert session.get.call_count == 1
@@ -0,0 +1,61 @@
+import pstats
+import threading
+import tracemalloc
+
+from profiling import NO_PROFILE, StageProfiler
+
+
+def allocate_lines():
+    return [str(number) * 10 for number in range(10000)]
+
+
+def test_stage_profiler_is_off_by_default():
+    profiler = StageProfiler()
+    assert profiler.stage('save') is NO_PROFILE
+    assert not tracemalloc.is_tracing()
+
+
+def test_stage_profiler_merges_threads(tmp_path):
+    profiler = StageProfiler()
+    profiler.enable()
+    try:
+        kept = []
+
+        def run_stage():
+            with profiler.stage('company_pages'), profiler.stage('nested'):
+                kept.append(allocate_lines())
+
+        threads = [threading.Thread(target=run_stage) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with profiler.stage('save'):
+            pass
+        profiler.save(str(tmp_path))
+    finally:
+        profiler.disable()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'company_pages.prof', 'company_pages.txt', 'profile.prof', 'save.prof', 'save.txt'
+    ]
+    calls = {function[2]: stat[1] for function, stat in pstats.Stats(str(tmp_path / 'profile.prof')).stats.items()}
+    assert calls['allocate_lines'] == 2
+    report = (tmp_path / 'company_pages.txt').read_text(encoding='utf-8')
+    assert 'Peak traced memory' in report
+    assert 'test_profiling.py' in report.split('Top functions')[0]
+
+
+def test_stage_profiler_skips_thread_if_another_profiler_is_active(mocker, monkeypatch, tmp_path):
+    # Python 3.12+ allows one active profiler, Python 3.7 and 3.8 have no tracemalloc.reset_peak
+    mocker.patch('cProfile.Profile').return_value.enable.side_effect = ValueError('Another profiling tool is active')
+    monkeypatch.delattr(tracemalloc, 'reset_peak', raising=False)
+    profiler = StageProfiler()
+    profiler.enable()
+    try:
+        with profiler.stage('company_pages'):
+            allocate_lines()
+        profiler.save(str(tmp_path))
+    finally:
+        profiler.disable()
+    assert list(tmp_path.iterdir()) == []
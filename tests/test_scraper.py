@@ -0,0 +1,131 @@
+import os
+import subprocess
+import sys
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from checkpoint import CheckpointJournal
+from metrics_collectors import CompanyFinIndicators, CompanyIndicators, CompanyQuarterlyReports
+from scraper import controller, FetchResult, iter_companies_indicators, iter_companies_prices
+from snapshot_store import SnapshotStore
+
+
+def test_iter_companies_prices(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshots.sqlite'))
+    run_id = store.start_run()
+    store.save(run_id, CompanyIndicators(ticker='SBER', ordinary_stock=250.1, preference_stock=220.5, profit=870.1),
+               'hash')
+    companies_list = {
+        'SBER': {'ordinary stock': 260.0, 'analysis_url': '/q/SBER/f/y/'},
+        'GAZP': {'ordinary stock': 150.0, 'analysis_url': '/q/GAZP/f/y/'},
+    }
+
+    companies = dict(iter_companies_prices(companies_list, store, ''))
+    assert list(companies) == ['SBER']
+    assert companies['SBER'].ordinary_stock == 260.0
+    assert companies['SBER'].preference_stock == ''
+    assert companies['SBER'].profit == 870.1
+    snapshot = store.last_snapshots()['SBER']
+    assert snapshot.run_id > run_id
+    assert snapshot.content_hash == 'hash'
+    assert snapshot.indicators.ordinary_stock == 260.0
+    store.close()
+
+
+def test_iter_companies_indicators_retries_failed_companies_at_the_end(tmp_path, mocker):
+    journal = CheckpointJournal(str(tmp_path / 'scraper.checkpoint'))
+    journal.record('SBER', CompanyIndicators(ticker='SBER', ordinary_stock=250.1, profit=870.1), 'sber')
+    journal.close()
+    calls = []
+
+    def fetch(company, indicators, *args):
+        calls.append(company)
+        if company == 'GAZP' and calls.count('GAZP') == 1:
+            raise AttributeError('changed page')
+        if company == 'LKOH':
+            raise AttributeError('changed page')
+        return FetchResult(CompanyIndicators(ticker=company, profit=1.0), company, None)
+
+    mocker.patch('scraper.fetch_company_indicators', side_effect=fetch)
+    companies_list = {company: {'ordinary stock': 100.0, 'analysis_url': f'/q/{company}/f/y/'}
+                      for company in ('SBER', 'GAZP', 'LKOH', 'MTSS')}
+    journal = CheckpointJournal(str(tmp_path / 'scraper.checkpoint'), resume=True)
+    companies = dict(iter_companies_indicators(companies_list, 'https://smart-lab.ru/', '', workers=2,
+                                               journal=journal))
+    journal.close()
+
+    assert list(companies) == ['SBER', 'MTSS', 'GAZP', 'LKOH']
+    assert companies['SBER'].profit == 870.1
+    assert companies['SBER'].ordinary_stock == 100.0
+    assert companies['GAZP'].profit == 1.0
+    assert companies['LKOH'].profit == ''
+    assert companies['LKOH'].ordinary_stock == 100.0
+    assert 'SBER' not in calls
+    assert list(CheckpointJournal(str(tmp_path / 'scraper.checkpoint'), resume=True).completed()) == [
+        'SBER', 'MTSS', 'GAZP'
+    ]
+
+
+@pytest.mark.parametrize('parse_workers', [0, 2])
+def test_iter_companies_indicators_adds_quarterly_reports(mocker, parse_workers):
+    # Parse pool is replaced by threads, so the patched parsers work in it
+    mocker.patch('scraper.ProcessPoolExecutor',
+                 side_effect=lambda max_workers, **kwargs: ThreadPoolExecutor(max_workers=max_workers))
+    fetch_threads, parse_threads = dict(), dict()
+
+    def fetch_page(collector):
+        fetch_threads[collector._url] = threading.current_thread()
+        return collector._url
+
+    def parse_quarters(reports, page):
+        parse_threads[page] = threading.current_thread()
+        if 'GAZP' in page:
+            raise AttributeError('changed page')
+        return {'quarter_profit': 2.0, 'profit_4q': 8.0}
+
+    for collector in (CompanyFinIndicators, CompanyQuarterlyReports):
+        mocker.patch.object(collector, 'fetch_page', autospec=True, side_effect=fetch_page)
+    mocker.patch.object(CompanyFinIndicators, 'parse_page', autospec=True,
+                        side_effect=lambda collector, page: CompanyIndicators(ticker=collector._ticker, profit=1.0))
+    mocker.patch.object(CompanyQuarterlyReports, 'parse_page', autospec=True, side_effect=parse_quarters)
+    companies_list = {company: {'ordinary stock': 100.0, 'analysis_url': f'/q/{company}/f/y/'}
+                      for company in ('SBER', 'GAZP', 'LKOH')}
+    companies = dict(iter_companies_indicators(companies_list, 'https://smart-lab.ru/', '', workers=2,
+                                               parse_workers=parse_workers, quarterly=True))
+
+    assert list(companies) == ['SBER', 'GAZP', 'LKOH']
+    assert companies['SBER'].quarter_profit == 2.0
+    assert companies['SBER'].profit_4q == 8.0
+    # Error of the quarterly reports leaves the annual indicators
+    assert companies['GAZP'].profit == 1.0
+    assert companies['GAZP'].quarter_profit == ''
+    for company in companies_list:
+        annual_url, quarterly_url = (f'https://smart-lab.ru/q/{company}/f/{period}/' for period in 'yq')
+        # Both pages of the company are downloaded by one thread with its session
+        assert fetch_threads[annual_url] is fetch_threads[quarterly_url]
+        # Quarterly page is parsed where the annual page is parsed
+        assert (parse_threads[quarterly_url] is fetch_threads[quarterly_url]) == (not parse_workers)
+
+
+def test_controller_rejects_resume_with_history(mocker):
+    mocker.patch('sys.argv', ['scraper.py', '-f', 'result.csv', '--checkpoint', 'scraper.checkpoint', '--resume',
+                              '--history', 'history'])
+    with pytest.raises(ValueError, match='History is selected for resume'):
+        controller()
+
+
+def test_controller_rejects_negative_rate(mocker):
+    mocker.patch('sys.argv', ['scraper.py', '-f', 'result.csv', '--rate', '-1'])
+    with pytest.raises(ValueError, match='requests per second'):
+        controller()
+
+
+def test_import_does_not_load_packages_of_optional_modes():
+    code = ('import sys, scraper; '
+            'print(*[name for name in ("numpy", "sqlite3", "http.server", "gspread", "bs4") if name in sys.modules])')
+    loaded = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.dirname(__file__)),
+                            check=True, capture_output=True, text=True).stdout.split()
+    assert loaded == []
@@ -0,0 +1,52 @@
+import pytest
+
+from indicators_table import IndicatorsTable
+from metrics_collectors import CompanyIndicators
+from screener import calc_ratios, parse_filter, parse_rank_keys, RATIOS, Screener
+
+
+@pytest.fixture
+def table():
+    return IndicatorsTable.from_indicators([
+        CompanyIndicators(ticker='SBER', ordinary_stock=250.0, capitalization=5000.0, profit=850.0,
+                          book_value=4000.0, dividends_ordinary=18.7, roe=20.1),
+        CompanyIndicators(ticker='GAZP', ordinary_stock=150.0, capitalization=3500.0, profit=1200.0,
+                          book_value=14000.0, dividends_ordinary=15.2, roe=8.2),
+        CompanyIndicators(ticker='MTSS', ordinary_stock=300.0, capitalization=600.0, profit=0.0, roe=60.0),
+        CompanyIndicators(ticker='ABCD', ordinary_stock=10.0, capitalization=10.0, profit=2.0),
+    ])
+
+
+def test_calc_ratios(table):
+    ratios = calc_ratios(table)
+    assert ratios['pe'].tolist() == [5.88, 2.92, None, 5.0]
+    assert ratios['pb'].tolist() == [1.25, 0.25, None, None]
+    assert ratios['dividend_yield'].tolist() == [7.48, 10.13, None, None]
+    assert ratios['ev_ebitda'].mask.all()
+
+
+@pytest.mark.parametrize('filters, rank, expected', [
+    ([], '', ['SBER', 'GAZP', 'MTSS', 'ABCD']),
+    (['pe < 5.5'], '', ['GAZP', 'ABCD']),
+    (['pe<10', 'roe >= 10'], '', ['SBER']),
+    ([], 'pe', ['GAZP', 'ABCD', 'SBER', 'MTSS']),
+    ([], '-roe', ['MTSS', 'SBER', 'GAZP', 'ABCD']),
+    (['ordinary_stock > 100'], '-dividend_yield,pe', ['GAZP', 'SBER', 'MTSS']),
+])
+def test_screener(table, filters, rank, expected):
+    screened = Screener([parse_filter(text) for text in filters], parse_rank_keys(rank)).screen(table)
+    assert screened.tickers.tolist() == expected
+    assert screened.header[-5:] == ('pe', 'ev_ebitda', 'pb', 'dividend_yield', 'dividend_yield_pref')
+
+
+@pytest.mark.parametrize('text', ['pe <', 'pe ~ 10', 'unknown > 1'])
+def test_screener_wrong_filter(table, text):
+    with pytest.raises(ValueError):
+        Screener([parse_filter(text)]).screen(table)
+
+
+@pytest.mark.parametrize('filters, rank', [(['unknown > 1'], ''), (['pe < 15'], 'roe,-unknown')])
+def test_screener_check_fields(filters, rank):
+    screener = Screener([parse_filter(text) for text in filters], parse_rank_keys(rank))
+    with pytest.raises(ValueError, match='unknown'):
+        screener.check_fields(set(IndicatorsTable.FIELDS) | set(RATIOS))
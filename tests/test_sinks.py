@@ -0,0 +1,71 @@
+import json
+import sqlite3
+
+import pytest
+
+from sinks import CsvSink, FanOut, JsonLinesSink, SqliteSink
+
+
+HEADER = ('ticker', 'price', 'pe')
+LINES = [('ASDF', '10.5', ''), ('QWER', '', '4')]
+
+
+def test_json_lines_sink(tmp_path):
+    path = tmp_path / 'result.jsonl'
+    sink = JsonLinesSink(str(path), HEADER)
+    sink.write(LINES)
+    sink.close()
+    records = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert records == [{'ticker': 'ASDF', 'price': '10.5', 'pe': None},
+                       {'ticker': 'QWER', 'price': None, 'pe': '4'}]
+
+
+def test_sqlite_sink_replaces_table(tmp_path):
+    path = str(tmp_path / 'result.sqlite')
+    for lines in (LINES, LINES[:1]):
+        sink = SqliteSink(path, HEADER, batch_size=1)
+        sink.write(lines)
+        sink.close()
+    with sqlite3.connect(path) as connection:
+        rows = connection.execute('SELECT * FROM indicators').fetchall()
+    assert rows == [('ASDF', '10.5', None)]
+
+
+def test_fan_out_writes_all_sinks(tmp_path):
+    csv_path, jsonl_path = tmp_path / 'result.csv', tmp_path / 'result.jsonl'
+    with FanOut([CsvSink(str(csv_path), HEADER), JsonLinesSink(str(jsonl_path), HEADER)]) as fan_out:
+        for line in LINES:
+            fan_out.write([line])
+    assert csv_path.read_text(encoding='utf-8').splitlines() == ['ticker,price,pe', 'ASDF,10.5,', 'QWER,,4']
+    assert len(jsonl_path.read_text(encoding='utf-8').splitlines()) == 2
+
+
+def test_fan_out_failed_sink_does_not_stop_others(mocker, tmp_path):
+    failed = mocker.Mock()
+    failed.name = 'failed'
+    failed.write.side_effect = OSError('disk is full')
+    jsonl_path = tmp_path / 'result.jsonl'
+    fan_out = FanOut([failed, JsonLinesSink(str(jsonl_path), HEADER)])
+    for line in LINES:
+        fan_out.write([line])
+    with pytest.raises(OSError):
+        fan_out.close()
+    assert failed.write.call_count == 1
+    failed.close.assert_not_called()
+    failed.abort.assert_called_once()
+    assert len(jsonl_path.read_text(encoding='utf-8').splitlines()) == 2
+
+
+def test_fan_out_aborts_sinks_on_error(tmp_path):
+    path = str(tmp_path / 'result.sqlite')
+    sink = SqliteSink(path, HEADER)
+    sink.write(LINES)
+    sink.close()
+    with pytest.raises(RuntimeError):
+        with FanOut([SqliteSink(path, HEADER)]) as fan_out:
+            fan_out.write(LINES[:1])
+            raise RuntimeError('fetch failed')
+    # Table of the previous run is kept
+    with sqlite3.connect(path) as connection:
+        rows = connection.execute('SELECT * FROM indicators').fetchall()
+    assert rows == [('ASDF', '10.5', None), ('QWER', None, '4')]
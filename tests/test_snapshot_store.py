@@ -0,0 +1,42 @@
+import pytest
+
+from metrics_collectors import CompanyIndicators
+from snapshot_store import Change, content_hash, SnapshotStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshots.sqlite'))
+    yield store
+    store.close()
+
+
+def test_snapshot_store_last_snapshots(store):
+    first_run = store.start_run()
+    store.save(first_run, CompanyIndicators(ticker='SBER', profit=870.1), content_hash('page'))
+    store.save(first_run, CompanyIndicators(ticker='GAZP', profit=1.5), content_hash('gazp'))
+    second_run = store.start_run()
+    store.save(second_run, CompanyIndicators(ticker='SBER', profit=900.0), content_hash('new page'))
+
+    snapshots = store.last_snapshots()
+    assert snapshots['SBER'].run_id == second_run
+    assert snapshots['SBER'].indicators.profit == 900.0
+    assert snapshots['GAZP'].content_hash == content_hash('gazp')
+    assert store.last_snapshots(before_run=second_run)['SBER'].indicators.profit == 870.1
+    assert store.resolve_run(-1) == second_run
+    assert list(store.load_run(first_run)) == ['SBER', 'GAZP']
+
+
+def test_snapshot_store_diff(store):
+    first_run = store.start_run()
+    store.save(first_run, CompanyIndicators(ticker='SBER', profit=870.1, roe=20.1))
+    store.save(first_run, CompanyIndicators(ticker='GAZP', company_name='Газпром'))
+    second_run = store.start_run()
+    store.save(second_run, CompanyIndicators(ticker='SBER', profit=900.0, roe=20.1))
+    store.save(second_run, CompanyIndicators(ticker='LKOH', company_name='Лукойл'))
+
+    assert store.diff(first_run, second_run) == [
+        Change('SBER', 'profit', 870.1, 900.0),
+        Change('GAZP', 'company_name', 'Газпром', ''),
+        Change('LKOH', 'company_name', '', 'Лукойл'),
+    ]
@@ -0,0 +1,34 @@
+import json
+
+from telemetry import Registry
+
+
+def test_registry_export():
+    registry = Registry()
+    responses = registry.counter('responses_total', 'HTTP responses')
+    fetch_seconds = registry.histogram('fetch_seconds', 'Fetch time', buckets=(0.1, 1.0, float('inf')))
+    responses.inc(code=200)
+    responses.inc(2, code=200)
+    responses.inc(code=429)
+    for value in (0.05, 0.5, 3.0):
+        fetch_seconds.observe(value)
+
+    assert registry.summary() == [
+        'responses_total{code="200"}: 3',
+        'responses_total{code="429"}: 1',
+        'fetch_seconds: count 3, total 3.550 s, mean 1183.3 ms, max 3000.0 ms',
+    ]
+    assert json.loads(registry.to_json())['fetch_seconds']['samples'][0]['value']['buckets'] == [1, 1, 1]
+    assert registry.to_prometheus().splitlines() == [
+        '# HELP responses_total HTTP responses',
+        '# TYPE responses_total counter',
+        'responses_total{code="200"} 3',
+        'responses_total{code="429"} 1',
+        '# HELP fetch_seconds Fetch time',
+        '# TYPE fetch_seconds histogram',
+        'fetch_seconds_bucket{le="0.1"} 1',
+        'fetch_seconds_bucket{le="1"} 2',
+        'fetch_seconds_bucket{le="+Inf"} 3',
+        'fetch_seconds_sum 3.55',
+        'fetch_seconds_count 3',
+    ]
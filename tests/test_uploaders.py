@@ -1,6 +1,8 @@
 import pytest
 
-from uploaders import GoogleSpreadsheets, save_to_google_spreadsheets, save_to_file
+from google_spreadsheets import GoogleSpreadsheets
+from metrics_collectors import CompanyIndicators
+from uploaders import indicators_lines
 
 
 @pytest.mark.parametrize('ordinary_stock, preference_stock, default_val, expected', [
@@ -9,28 +11,28 @@ from uploaders import GoogleSpreadsheets, save_to_google_spreadsheets, save_to_f
     ('4234', '4', '4', 1),
     ('9', '9', '9', 0),
 ])
-def test_save_to_google_spreadsheets(mocker, ordinary_stock, preference_stock, default_val, expected):
-    indicators = {'ASDF': mocker.Mock(ordinary_stock=ordinary_stock, preference_stock=preference_stock)}
-    mocker.patch('uploaders.GoogleSpreadsheets.__init__', return_value=None)
-    mocker.patch('uploaders.GoogleSpreadsheets.upload')
-    add_line_cells = mocker.patch('uploaders.GoogleSpreadsheets.add_line_cells')
-    save_to_google_spreadsheets(indicators, 'url', 'file_path', (1, 3, 5), default_val)
-    assert add_line_cells.call_count == expected
+def test_indicators_lines(ordinary_stock, preference_stock, default_val, expected):
+    indicators = CompanyIndicators(ticker='ASDF', ordinary_stock=ordinary_stock, preference_stock=preference_stock)
+    assert len(indicators_lines(indicators, default_val)) == expected
 
 
-@pytest.mark.parametrize('ordinary_stock, preference_stock, default_val, expected', [
-    ('123', '456.4', '', 3),
-    ('1', '456,6', '1', 2),
-    ('4234', '4', '4', 2),
-    ('9', '9', '9', 1),
-])
-def test_save_to_file(mocker, ordinary_stock, preference_stock, default_val, expected):
-    indicators = {'ASDF': mocker.Mock(ordinary_stock=ordinary_stock, preference_stock=preference_stock)}
-    writer = mocker.Mock()
-    mocker.patch('uploaders.csv.writer', return_value=writer)
-    mocker.patch('uploaders.open')
-    save_to_file(indicators, 'file_path', default_val)
-    assert writer.writerow.call_count == expected
+def test_indicators_lines_extra_fields():
+    indicators = CompanyIndicators(ticker='SBER', ordinary_stock=250.1, preference_stock=220.5, quarter_profit=194.3)
+    lines = indicators_lines(indicators, '', ('quarter_profit', 'profit_4q'))
+    assert [line[1] for line in lines] == ['SBER', 'SBERP']
+    assert [line[-2:] for line in lines] == [[194.3, ''], [194.3, '']]
+    assert len(lines[0]) == len(CompanyIndicators.HEADER) + 2
+
+
+@pytest.fixture
+def spreadsheet(mocker):
+    google_spreadsheets = mocker.Mock()
+    spreadsheet = google_spreadsheets.open_by_url.return_value
+    spreadsheet.id = 'id'
+    spreadsheet.get_worksheet.return_value.title = 'Sheet'
+    mocker.patch('google_spreadsheets.gspread.authorize', return_value=google_spreadsheets)
+    mocker.patch('google_spreadsheets.ServiceAccountCredentials')
+    return spreadsheet
 
 
 @pytest.mark.parametrize('indicators, expected', [
@@ -38,15 +40,47 @@ def test_save_to_file(mocker, ordinary_stock, preference_stock, default_val, exp
     (['ASDF'], 1),
     (['ASDF', '23.6', 'qwerty', 'asd', 'zxc'], 5),
 ])
-def test_google_spreadsheets(mocker, indicators, expected):
-    worksheet = mocker.Mock()
-    google_spreadsheets = mocker.Mock()
-    google_spreadsheets.open_by_url.return_value.get_worksheet.return_value = worksheet
-    mocker.patch('uploaders.gspread.authorize', return_value=google_spreadsheets)
-    mocker.patch('uploaders.gspread.models')
-    mocker.patch('uploaders.ServiceAccountCredentials')
-
+def test_google_spreadsheets(spreadsheet, indicators, expected):
     table = GoogleSpreadsheets('url', (1, 99, 5), 'file_path')
     table.add_line_cells(indicators)
     table.upload()
-    assert len(worksheet.update_cells.call_args.args[0]) == expected
+    assert spreadsheet.values_update.call_args.args[0] == "'Sheet'!E99"
+    assert len(spreadsheet.values_update.call_args.kwargs['body']['values'][0]) == expected
+
+
+@pytest.mark.parametrize('lines, chunk_size, expected_ranges', [
+    (1, 500, ["'Sheet'!A3"]),
+    (5, 2, ["'Sheet'!A3", "'Sheet'!A5", "'Sheet'!A7"]),
+    (4, 2, ["'Sheet'!A3", "'Sheet'!A5"]),
+])
+def test_google_spreadsheets_chunks(spreadsheet, lines, chunk_size, expected_ranges):
+    table = GoogleSpreadsheets('url', (1, 3, 1), 'file_path', chunk_size)
+    for num_line in range(lines):
+        table.add_line_cells([f'company {num_line}', num_line])
+    table.upload()
+    assert [call.args[0] for call in spreadsheet.values_update.call_args_list] == expected_ranges
+    assert sum(len(call.kwargs['body']['values']) for call in spreadsheet.values_update.call_args_list) == lines
+
+
+def test_google_spreadsheets_diff(spreadsheet):
+    spreadsheet.values_get.return_value = {'values': [
+        ['header'],
+        ['Сбербанк', 'SBER', 250.1, 870, 12.5, 'old'],
+        ['Газпром', 'GAZP', 150, 1.5, 'old'],
+    ]}
+    table = GoogleSpreadsheets('url', (1, 2, 1), 'file_path', diff=True)
+    table.add_line_cells(['Сбербанк', 'SBER', 251.0, 870.0, ''])
+    table.add_line_cells(['Газпром', 'GAZP', 155.5, 1.6, 'old', 'new'])
+    table.add_line_cells(['Лукойл', 'LKOH'])
+    table.upload()
+    spreadsheet.values_update.assert_not_called()
+    assert spreadsheet.values_get.call_args.args[0] == "'Sheet'"
+    assert spreadsheet.client.request.call_args.kwargs['json']['data'] == [
+        {'range': "'Sheet'!C2", 'values': [[251.0]]},
+        # Value that has become empty and the cell after the end of the line are cleared
+        {'range': "'Sheet'!E2", 'values': [['', '']]},
+        {'range': "'Sheet'!C3", 'values': [[155.5, 1.6]]},
+        {'range': "'Sheet'!F3", 'values': [['new']]},
+        {'range': "'Sheet'!A4", 'values': [['Лукойл', 'LKOH']]},
+    ]
+
@@ -0,0 +1,88 @@
+import json
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from page_parsers import FIN_TABLE_CLASS
+from utils import get_arg_params, HtmlFetcher, Logger, PAGE_BLOCK_SIZE
+
+
+def test_html_fetcher_session_per_thread():
+    fetcher = HtmlFetcher()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # Sessions are kept, so the id of a collected session is not reused by another one
+        sessions = list(executor.map(lambda _: HtmlFetcher()._session, range(2)))
+    assert fetcher._session is HtmlFetcher()._session
+    assert all(session is not fetcher._session for session in sessions)
+
+
+def test_html_fetcher_revalidates_cached_page(mocker):
+    cache = mocker.Mock()
+    cache.get.return_value = mocker.Mock(text='cached', etag='"abc"', last_modified=None)
+    cache.is_fresh.return_value = False
+    session = mocker.Mock()
+    session.get.return_value = mocker.Mock(status_code=304, raw=mocker.Mock(**{'tell.return_value': 0}))
+    mocker.patch.object(HtmlFetcher, '_session', session)
+    mocker.patch.object(HtmlFetcher, '_cache', cache)
+
+    assert HtmlFetcher().fetch_page('url') == 'cached'
+    assert session.get.call_args.kwargs['headers']['If-None-Match'] == '"abc"'
+    cache.refresh.assert_called_once_with('url')
+
+
+@pytest.mark.parametrize('chunk_size', [100, 5000])
+def test_html_fetcher_stops_after_table(mocker, chunk_size):
+    filler = '<p>новости</p>' * 2000
+    page = f'<html><body>{filler}<table class="{FIN_TABLE_CLASS}"><tr><td>1</td></tr></table>{filler}</body></html>'
+    chunks = [page[start:start + chunk_size] for start in range(0, len(page), chunk_size)]
+    response = mocker.Mock(status_code=200, encoding='utf-8', headers={}, raw=mocker.Mock(**{'tell.return_value': 0}))
+    response.iter_content.return_value = iter(chunks)
+    session = mocker.Mock()
+    session.get.return_value = response
+    mocker.patch.object(HtmlFetcher, '_session', session)
+    mocker.patch.object(HtmlFetcher, '_scheduler', None)
+    mocker.patch.object(HtmlFetcher, '_cache', None)
+
+    text = HtmlFetcher().fetch_page('url', until_table=FIN_TABLE_CLASS)
+    # The page is cut by blocks independently of the chunks received from the network
+    assert len(text) % PAGE_BLOCK_SIZE == 0
+    assert '</table>' in text and len(text) < len(page)
+    assert page.startswith(text)
+    assert session.get.call_args.kwargs['stream']
+    response.close.assert_called_once()
+
+
+def test_queued_logger_rotates_log_and_writes_json(tmp_path):
+    log_path = tmp_path / 'queued.log'
+    log_path.write_text('previous run\n', encoding='utf-8')
+    logger = Logger('queued', queued=True)
+    logger.set_logs('file', logs_directory=str(tmp_path))
+    logger.set_format('file', 'json')
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda num: logger.info('company %s', num), range(20)))
+    logger.close_logs('file')
+
+    records = [json.loads(line) for line in log_path.read_text(encoding='utf-8').splitlines()]
+    assert sorted(record['message'] for record in records) == sorted(f'company {num}' for num in range(20))
+    assert records[0]['level'] == 'INFO'
+    assert (tmp_path / 'queued.log.1').read_text(encoding='utf-8') == 'previous run\n'
+
+
+def test_queued_logger_close_logs_interrupted(tmp_path, mocker):
+    logger = Logger('interrupted', queued=True)
+    logger.set_logs('file', logs_directory=str(tmp_path))
+    restart = mocker.patch.object(logger, '_Logger__restart_listener', side_effect=KeyboardInterrupt)
+    with pytest.raises(KeyboardInterrupt):
+        logger.close_logs('file')
+    # Closing again, as the cleanup after the interruption does, is a no-op
+    logger.close_logs('file')
+    assert restart.call_count == 1
+    mocker.stopall()
+    # Listener of the interrupted restart is stopped, as there are no handlers left
+    logger._Logger__restart_listener()
+
+
+def test_get_arg_params_descending_first_rank_key(mocker):
+    mocker.patch('sys.argv', ['scraper.py', '-f', 'result.csv', '--rank=-roe,pe'])
+    assert get_arg_params()['rank'] == '-roe,pe'
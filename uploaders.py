@@ -5,70 +5,72 @@
 
 import csv
 
-import gspread
-
-from oauth2client.service_account import ServiceAccountCredentials
-
+from metrics_collectors import CompanyIndicators
 from utils import Logger
 
 
 logger = Logger('scraper')
 
 
-class GoogleSpreadsheets:
-    """Class for upload cell list to google table."""
-    def __init__(self, url_table, start_position, json_key_file):
-        scope = ['https://spreadsheets.google.com/feeds',
-                 'https://www.googleapis.com/auth/drive']
-        credentials = ServiceAccountCredentials.from_json_keyfile_name(json_key_file, scope)
-        google_spreadsheets = gspread.authorize(credentials)
-        worksheets = google_spreadsheets.open_by_url(url_table)
-        num_list_table, self._current_row, self._current_column = start_position
-        self._worksheet = worksheets.get_worksheet(num_list_table)
-        self._cell_list = []
-
-    def upload(self):
-        """Upload cell list to google table"""
-        self._worksheet.update_cells(self._cell_list)
-
-    def add_line_cells(self, company_indicators):
-        """Adds cells in order on one line. And increment the number current line table by 1"""
-        self._cell_list += [
-            gspread.models.Cell(self._current_row, num_col, value=param)
-            for num_col, param in enumerate(company_indicators, start=self._current_column)
-        ]
-        self._current_row += 1
-
-
-def save_to_google_spreadsheets(companies_indicators, table_url, google_key_file, start_position, default_cell_val=''):
-    """Save data to goggle table."""
-    logger.info('Create table')
-
-    table = GoogleSpreadsheets(table_url, start_position, google_key_file)
-    for indicators in companies_indicators.values():
-        if indicators.ordinary_stock != default_cell_val:
-            table.add_line_cells(indicators.indicators_ordinary.values())
-        if indicators.preference_stock != default_cell_val:
-            table.add_line_cells(indicators.indicators_preference.values())
-    logger.info('Upload table')
-    table.upload()
-    logger.info("Upload data to google spreadsheets complete.")
-
-
-def save_to_file(companies_indicators, path, default_cell_val=''):
-    """Save file on disk."""
-    logger.info("Save to file.")
+def open_google_spreadsheets(table_url, start_position, google_key_file, chunk_size=500, diff=False):
+    """Return GoogleSpreadsheets. Google client is imported only when results are uploaded to google spreadsheets."""
+    from google_spreadsheets import GoogleSpreadsheets
+    return GoogleSpreadsheets(table_url, start_position, google_key_file, chunk_size, diff)
+
+
+def indicators_lines(indicators, default_cell_val='', extra_fields=()):
+    """Return table lines of the company: one line for every type of the company stock.
+
+    Values of extra_fields are added to the end of every line.
+    """
+    extra = [getattr(indicators, field) for field in extra_fields]
+    lines = []
+    if indicators.ordinary_stock != default_cell_val:
+        lines.append(list(indicators.indicators_ordinary.values()) + extra)
+    if indicators.preference_stock != default_cell_val:
+        lines.append(list(indicators.indicators_preference.values()) + extra)
+    return lines
+
+
+class CsvFile:
+    """Writes companies indicators to csv file line by line."""
+    def __init__(self, path, default_cell_val='', header=CompanyIndicators.HEADER):
+        self._file = open(path, "w", newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._default_cell_val = default_cell_val
+        self._header = header
+        self._header_written = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write_lines(self, lines):
+        """Write lines of companies after the header."""
+        self.write_header()
+        for line in lines:
+            self._writer.writerow(line)
+
+    def write_header(self):
+        """Write header if it has not been written yet."""
+        if not self._header_written:
+            self._writer.writerow(self._header)
+            self._header_written = True
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def save_changes_to_file(changes, path):
+    """Save changed indicators on disk."""
+    logger.info("Save changes to file.")
     with open(path, "w", newline='', encoding='utf-8') as csv_file:
         writer = csv.writer(csv_file)
-        header = False
-        for indicators in companies_indicators.values():
-            if not header:
-                writer.writerow(indicators.indicators_ordinary)
-                header = True
-
-            if indicators.ordinary_stock != default_cell_val:
-                writer.writerow(indicators.indicators_ordinary.values())
-
-            if indicators.preference_stock != default_cell_val:
-                writer.writerow(indicators.indicators_preference.values())
-    logger.info("Write to file complete.")
+        writer.writerow(('ticker', 'indicator', 'old value', 'new value'))
+        writer.writerows(changes)
+    logger.info(f"Write {len(changes)} changes to file complete.")
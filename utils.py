@@ -3,45 +3,183 @@
 """Some auxiliary utils."""
 
 import argparse
+import json
 import os
+import threading
 
-from logging import Formatter, getLogger, FileHandler, StreamHandler
+from datetime import datetime
+from logging import Formatter, getLogger, StreamHandler
 from logging import INFO, DEBUG
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
 
 import requests
 
+from telemetry import CACHE_REQUESTS, DOWNLOADED_BYTES, FETCH_ERRORS, FETCH_SECONDS, HTTP_RESPONSES
+
 
 class BadResponseCode(ConnectionError):
     """Bad response code"""
 
 
+# Page is read by blocks of characters, so the page cut after the table is the same in every run and its hash
+# does not depend on the sizes of network packets
+PAGE_BLOCK_SIZE = 16 * 1024
+
+
 class HtmlFetcher:
-    """HTML file downloader."""
-    _session = None
+    """HTML file downloader. Each thread uses its own HTTP session."""
+    _local = threading.local()
+    _cache = None
+    _scheduler = None
+    _archive = None
+    _snapshot_id = None
+    _replay = False
+
+    @property
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    @classmethod
+    def set_cache(cls, cache):
+        """Set cache of downloaded pages for all fetchers. None disables caching."""
+        cls._cache = cache
+
+    @classmethod
+    def set_scheduler(cls, scheduler):
+        """Set scheduler of requests (rate limit and retries) for all fetchers. None - single request without limits."""
+        cls._scheduler = scheduler
+
+    @classmethod
+    def set_archive(cls, archive, snapshot_id=None, replay=False):
+        """Set archive of pages for all fetchers. None disables archiving.
+
+        Downloaded pages are appended to the snapshot of the archive. In replay mode pages are taken from the
+        snapshot without requests to the site.
+        """
+        cls._archive = archive
+        cls._snapshot_id = snapshot_id
+        cls._replay = replay
+
+    def fetch_page(self, url, until_table=None, revalidate=False):
+        """Download html page and return text from this page.
 
-    def __init__(self):
-        if not self._session:
-            __class__._session = requests.Session()
+        until_table - class of the table: the download stops a block after the end of the first table with this
+        class, the rest of the page is not received. If revalidate is True, the cached page is used only after
+        the conditional request, even if it is fresh.
+        """
+        if self._replay:
+            archived_page = self._archive.get(url, self._snapshot_id)
+            if archived_page is None:
+                FETCH_ERRORS.inc(error='NotArchived')
+                raise ConnectionError(f'Page "{url}" not found in archive')
+            return archived_page.text
+        text = self.__download(url, until_table, revalidate)
+        if self._archive:
+            self._archive.put(self._snapshot_id, url, text)
+        return text
 
-    def fetch_page(self, url):
-        """Download html page and return text from this page."""
+    def __download(self, url, until_table=None, revalidate=False):
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; Win64; x64; rv:72.0) Gecko/20100101 Firefox/72.0',
+            'Accept-Encoding': 'gzip, deflate',
         }
 
+        cached_page = self._cache.get(url) if self._cache else None
+        if cached_page:
+            if not revalidate and self._cache.is_fresh(cached_page):
+                CACHE_REQUESTS.inc(result='fresh')
+                return cached_page.text
+            # Conditional request: the site responds 304 if the page has not changed
+            if cached_page.etag:
+                headers['If-None-Match'] = cached_page.etag
+            if cached_page.last_modified:
+                headers['If-Modified-Since'] = cached_page.last_modified
+        elif self._cache:
+            CACHE_REQUESTS.inc(result='miss')
+
+        text = None
+
+        def send():
+            nonlocal text
+            response = self._session.get(url, headers=headers, timeout=5, stream=True)
+            HTTP_RESPONSES.inc(code=response.status_code)
+            try:
+                if response.status_code == requests.codes.ok:
+                    text = self.__read_text(response, until_table)
+            finally:
+                # Connection of the response read to the end is returned to the session, otherwise it is closed
+                response.close()
+                DOWNLOADED_BYTES.inc(response.raw.tell())
+            return response
+
         try:
-            response = self._session.get(url, headers=headers, timeout=5)
-        except requests.exceptions:
+            with FETCH_SECONDS.time():
+                response = self._scheduler.request(send, url) if self._scheduler else send()
+        except requests.exceptions.RequestException as error:
+            FETCH_ERRORS.inc(error=type(error).__name__)
             raise ConnectionError(f'Failed to establish connection with "{url}"')
+        if cached_page and response.status_code == requests.codes.not_modified:
+            CACHE_REQUESTS.inc(result='revalidated')
+            self._cache.refresh(url)
+            return cached_page.text
         if response.status_code != requests.codes.ok:
+            FETCH_ERRORS.inc(error=BadResponseCode.__name__)
             raise BadResponseCode(f'Url: "{url}". Response code:{response.status_code}')
-        return response.text
+        if self._cache:
+            self._cache.put(url, text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return text
+
+    @staticmethod
+    def __read_text(response, until_table):
+        """Return text of the response body. Body is decoded and checked for the end of the table block by block."""
+        if until_table is None:
+            return response.text
+        from page_parsers import TableEndDetector
+        table_end = TableEndDetector(until_table)
+        # Encoding is not guessed from the body, because the whole body is not read
+        response.encoding = response.encoding or 'utf-8'
+        blocks = []
+        rest = ''
+        for chunk in response.iter_content(PAGE_BLOCK_SIZE, decode_unicode=True):
+            rest += chunk
+            while len(rest) >= PAGE_BLOCK_SIZE:
+                blocks.append(rest[:PAGE_BLOCK_SIZE])
+                rest = rest[PAGE_BLOCK_SIZE:]
+                if table_end.feed(blocks[-1]):
+                    return ''.join(blocks)
+        blocks.append(rest)
+        return ''.join(blocks)
+
+
+class JsonFormatter(Formatter):
+    """Formats record as one line of JSON."""
+
+    def format(self, record):
+        message = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+            'file': record.filename,
+            'line': record.lineno,
+        }
+        if record.exc_info:
+            message['exception'] = self.formatException(record.exc_info)
+        return json.dumps(message, ensure_ascii=False)
 
 
 class Logger:
-    """Writes system state to log files."""
+    """Writes system state to log files.
+
+    In queued mode records are put to the in-memory queue and written to files and console by one listener thread,
+    so threads writing logs do not wait for disk and terminal.
+    """
 
-    def __init__(self, name=None):
+    def __init__(self, name=None, queued=False):
         self.__name = name
         self.__loggers = {'file': self.__file_logger,
                           'console': self.__console_logger
@@ -49,9 +187,13 @@ class Logger:
         self.__log_level = {'info': INFO, 'debug': DEBUG}
         self.__modes = []
         self.__logs_directory = ''
-        self.__common_log_handler = None
-        self.__console_log_handler = None
+        self.__max_bytes = 0
+        self.__backup_count = 0
+        self.__handlers = dict()
         self.__log_format = None
+        self.__queued = queued
+        self.__queue_handler = None
+        self.__listener = None
 
         self.__logger = getLogger(self.__name)
 
@@ -61,8 +203,12 @@ class Logger:
         self.error = self.__logger.error
         self.critical = self.__logger.critical
 
-    def set_logs(self, mode=None, message_level='info', logs_directory=None):
-        """Set logger handlers."""
+    def set_logs(self, mode=None, message_level='info', logs_directory=None, max_bytes=10 * 1024 * 1024,
+                 backup_count=5):
+        """Set logger handlers.
+
+        Log file is rotated on every start and when it grows to max_bytes, backup_count old logs are kept.
+        """
         if mode not in self.__loggers:
             raise ValueError('Mode "{mode}" is not support')
         self.__modes.append(mode)
@@ -70,44 +216,73 @@ class Logger:
             if not logs_directory:
                 raise ValueError('"logs_path" should not be None')
             self.__logs_directory = logs_directory
+            self.__max_bytes = max_bytes
+            self.__backup_count = backup_count
 
         self.__logger.setLevel(self.__log_level[message_level])
 
         message_format = '%(levelname)-8s %(asctime)s %(message)-60s (%(filename)s:%(lineno)d)'
         self.__log_format = Formatter(fmt=message_format, datefmt="%y-%m-%d %H:%M:%S")
-        self.__loggers.get(mode).__call__()
+        handler = self.__loggers.get(mode).__call__()
+        self.__handlers[mode] = handler
+        if self.__queued:
+            self.__restart_listener()
+        else:
+            self.__logger.addHandler(handler)
+
+    def set_format(self, mode, log_format='text'):
+        """Set format of the logs: "text" or "json" (one line of JSON for every record)."""
+        if mode not in self.__handlers:
+            return
+        self.__handlers[mode].setFormatter(JsonFormatter() if log_format == 'json' else self.__log_format)
 
     def __file_logger(self):
-        """Create and start loggers file handler."""
+        """Create loggers file handler. Existing log is renamed to "<name>.log.1"."""
         log_file = f'{self.__name}.log'
         log_file_path = os.path.join(self.__logs_directory, log_file)
 
-        # Existing log rewriting
-        if os.path.exists(log_file_path):
-            os.remove(log_file_path)
-
-        self.__common_log_handler = FileHandler(log_file_path, mode='w', encoding='utf-8')
-        self.__common_log_handler.setFormatter(self.__log_format)
-
-        self.__logger.addHandler(self.__common_log_handler)
+        handler = RotatingFileHandler(log_file_path, maxBytes=self.__max_bytes, backupCount=self.__backup_count,
+                                      encoding='utf-8')
+        if os.path.getsize(log_file_path):
+            handler.doRollover()
+        handler.setFormatter(self.__log_format)
+        return handler
 
     def __console_logger(self):
-        """Create and start loggers console handler."""
-        self.__console_log_handler = StreamHandler()
-        self.__console_log_handler.setFormatter(self.__log_format)
-        self.__logger.addHandler(self.__console_log_handler)
+        """Create loggers console handler."""
+        handler = StreamHandler()
+        handler.setFormatter(self.__log_format)
+        return handler
+
+    def __restart_listener(self):
+        """Start listener writing queued records to the current handlers. Records queued before are written first."""
+        if self.__listener:
+            self.__listener.stop()
+            self.__listener = None
+        if not self.__handlers:
+            self.__logger.removeHandler(self.__queue_handler)
+            self.__queue_handler = None
+            return
+        if self.__queue_handler is None:
+            self.__queue_handler = QueueHandler(SimpleQueue())
+            self.__logger.addHandler(self.__queue_handler)
+        self.__listener = QueueListener(self.__queue_handler.queue, *self.__handlers.values())
+        self.__listener.start()
 
     def close_logs(self, mode=None):
         """Close logger handlers."""
         if mode not in self.__modes:
             return
-        if mode == 'file':
-            self.__common_log_handler.close()
-            self.__logger.removeHandler(self.__common_log_handler)
-        elif mode == 'console':
-            self.__console_log_handler.close()
-            self.__logger.removeHandler(self.__console_log_handler)
+        # Mode is removed first, so the state stays consistent if the restart of the listener is interrupted
         self.__modes.remove(mode)
+        handler = self.__handlers.pop(mode)
+        try:
+            if self.__queued:
+                self.__restart_listener()
+            else:
+                self.__logger.removeHandler(handler)
+        finally:
+            handler.close()
 
 
 def get_arg_params():
@@ -122,9 +297,220 @@ def get_arg_params():
                             help='Link to google spreadsheets and file name JSON keyfile from google. '
                                  'Details see in the README.MD'
                             )
+    cmd_parser.add_argument('--gsheet-chunk',
+                            dest='gsheet_chunk',
+                            type=int,
+                            default=500,
+                            help='Maximum number of lines (or changed ranges with --gsheet-diff) '
+                                 'in one request to google spreadsheets. Default: 500'
+                            )
+    cmd_parser.add_argument('--gsheet-diff',
+                            dest='gsheet_diff',
+                            action='store_true',
+                            help='Read google table once and upload only changed cells'
+                            )
     cmd_parser.add_argument('-f',
                             dest='file_name',
                             default='',
                             help='Save result to file. Need write file name. Example: "fin_indicators_companies.csv"'
                             )
+    cmd_parser.add_argument('--jsonl',
+                            dest='jsonl_path',
+                            default='',
+                            help='Save result to JSON Lines file: one JSON object for every line of the table. '
+                                 'Example: "fin_indicators_companies.jsonl"'
+                            )
+    cmd_parser.add_argument('--sqlite',
+                            dest='sqlite_path',
+                            default='',
+                            help='Save result to table "indicators" of SQLite database. The table is replaced '
+                                 'on every run. Example: "fin_indicators.sqlite"'
+                            )
+    cmd_parser.add_argument('--site',
+                            dest='site_url',
+                            default='https://smart-lab.ru/',
+                            help='Address of the site. Default: https://smart-lab.ru/'
+                            )
+    cmd_parser.add_argument('-w',
+                            dest='workers',
+                            type=int,
+                            default=1,
+                            help='Number of companies pages fetched in parallel. Default: 1 (serial fetching)'
+                            )
+    cmd_parser.add_argument('--quarterly',
+                            dest='quarterly',
+                            action='store_true',
+                            help='Fetch the page of quarterly reports of every company right after the page of '
+                                 'annual reports, by the same thread. Adds profit and proceeds of the last quarter and their sums for '
+                                 'the last four quarters'
+                            )
+    cmd_parser.add_argument('--parse-workers',
+                            dest='parse_workers',
+                            type=int,
+                            default=0,
+                            help='Number of processes parsing downloaded companies pages. '
+                                 'Default: 0 (pages are parsed in the fetching threads)'
+                            )
+    cmd_parser.add_argument('--filter',
+                            dest='filters',
+                            action='append',
+                            default=[],
+                            help='Save only companies matching the filter. Filter is indicator or ratio '
+                                 '(pe, ev_ebitda, pb, dividend_yield, dividend_yield_pref), comparison and number. '
+                                 'Can be repeated. Example: --filter "pe < 15" --filter "roe >= 10"'
+                            )
+    cmd_parser.add_argument('--rank',
+                            dest='rank',
+                            default='',
+                            help='Sort companies by indicators or ratios separated by commas. '
+                                 '"-" before the name - descending order. If the first key is descending, the value '
+                                 'is given after "=", otherwise it is taken for an option. Example: "pe,-roe", '
+                                 '"--rank=-roe,pe"'
+                            )
+    cmd_parser.add_argument('--stream',
+                            dest='stream',
+                            action='store_true',
+                            help='Write every company to file as soon as it is fetched. '
+                                 'Fetched companies are not kept in memory'
+                            )
+    cmd_parser.add_argument('--rate',
+                            dest='rate',
+                            type=float,
+                            default=0,
+                            help='Maximum number of requests per second to one site. Default: 0 (no limit)'
+                            )
+    cmd_parser.add_argument('--retries',
+                            dest='retries',
+                            type=int,
+                            default=3,
+                            help='Number of retries of the request after response 429, 5xx or timeout. Default: 3'
+                            )
+    cmd_parser.add_argument('--parser',
+                            dest='parser',
+                            choices=('lxml', 'soup'),
+                            default='lxml',
+                            help='Pages parser. "lxml" - fast incremental parser, '
+                                 '"soup" - full BeautifulSoup tree. Default: lxml'
+                            )
+    cmd_parser.add_argument('--store',
+                            dest='store_path',
+                            default='',
+                            help='Save indicators of every run to the store file. Example: "snapshots.sqlite"'
+                            )
+    cmd_parser.add_argument('--incremental',
+                            dest='incremental',
+                            action='store_true',
+                            help='Parse only companies whose pages have changed since the last run in the store. '
+                                 'Indicators of other companies are taken from the store'
+                            )
+    cmd_parser.add_argument('--prices-only',
+                            dest='prices_only',
+                            action='store_true',
+                            help='Fetch only the list of companies and update stocks prices in the indicators '
+                                 'of the last run in the store. Companies pages are not fetched'
+                            )
+    cmd_parser.add_argument('--diff',
+                            dest='diff',
+                            nargs=2,
+                            type=int,
+                            metavar=('OLD_RUN', 'NEW_RUN'),
+                            help='Save to file (-f) only indicators changed between two runs from the store. '
+                                 'Negative numbers count runs from the end: "-2 -1" - two last runs'
+                            )
+    cmd_parser.add_argument('--checkpoint',
+                            dest='checkpoint_path',
+                            default='',
+                            help='Record every fetched company to the journal file. The journal is removed when '
+                                 'the run is finished. Example: "scraper.checkpoint"'
+                            )
+    cmd_parser.add_argument('--resume',
+                            dest='resume',
+                            action='store_true',
+                            help='Continue the run stopped with error: companies from the checkpoint journal '
+                                 'are not fetched again'
+                            )
+    cmd_parser.add_argument('--history',
+                            dest='history_path',
+                            default='',
+                            help='Save all rows of companies financial statements by years to files '
+                                 '"<history>.npy" (array tickers x fields x years) and "<history>.json" (index). '
+                                 'Example: "history"'
+                            )
+    cmd_parser.add_argument('--archive',
+                            dest='archive_path',
+                            default='',
+                            help='Append every downloaded page to the archive file as a new snapshot. '
+                                 'Example: "pages_archive.sqlite"'
+                            )
+    cmd_parser.add_argument('--replay',
+                            dest='replay',
+                            type=int,
+                            metavar='SNAPSHOT',
+                            help='Extract indicators from the pages of the snapshot of the archive without requests '
+                                 'to the site. Negative numbers count snapshots from the end: "-1" - the last snapshot'
+                            )
+    cmd_parser.add_argument('--serve',
+                            dest='serve',
+                            type=int,
+                            metavar='PORT',
+                            help='Run as a service: refresh indicators on schedule and serve them on the port by '
+                                 'HTTP/JSON API. Port 0 - any free port, the port is written to the log. Example: '
+                                 '"--serve 8000"'
+                            )
+    cmd_parser.add_argument('--host',
+                            dest='host',
+                            default='127.0.0.1',
+                            help='Address of the service. Default: 127.0.0.1'
+                            )
+    cmd_parser.add_argument('--refresh-interval',
+                            dest='refresh_interval',
+                            type=float,
+                            default=60,
+                            help='Minutes between refreshes of indicators in service mode. Default: 60'
+                            )
+    cmd_parser.add_argument('--log-format',
+                            dest='log_format',
+                            choices=('text', 'json'),
+                            default='text',
+                            help='Format of the log file: "text" or "json" (one line of JSON for every record). '
+                                 'Default: text'
+                            )
+    cmd_parser.add_argument('--metrics-file',
+                            dest='metrics_file',
+                            default='',
+                            help='Save metrics of the run (counters and timings of download, parse and upload) '
+                                 'to file. Example: "metrics.json"'
+                            )
+    cmd_parser.add_argument('--metrics-format',
+                            dest='metrics_format',
+                            choices=('json', 'prometheus'),
+                            default='json',
+                            help='Format of metrics file: "json" or "prometheus" text format. Default: json'
+                            )
+    cmd_parser.add_argument('--profile',
+                            dest='profile_dir',
+                            default='',
+                            help='Profile stages of the run: list of companies, companies pages and saving of results. '
+                                 'Report of every stage (functions by cumulative time, allocation sites, peak memory) '
+                                 'and profile.prof of all stages for profile viewers are written to the directory. '
+                                 'Parsing in --parse-workers processes is not profiled. Example: "profile"'
+                            )
+    cmd_parser.add_argument('--cache',
+                            dest='cache_path',
+                            default='',
+                            help='Cache downloaded pages in file. Example: "pages_cache.sqlite"'
+                            )
+    cmd_parser.add_argument('--cache-ttl',
+                            dest='cache_ttl',
+                            type=float,
+                            default=24,
+                            help='Hours during which cached page used without request to the site. The list of '
+                                 'companies with prices is always revalidated. Default: 24'
+                            )
+    cmd_parser.add_argument('--cache-size',
+                            dest='cache_size',
+                            type=float,
+                            default=100,
+                            help='Maximum size of cache in megabytes. Default: 100'
+                            )
     return vars(cmd_parser.parse_args())